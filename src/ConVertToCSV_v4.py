@@ -1,28 +1,36 @@
 import pandas as pd
 import numpy as np
-from collections import Counter
 import glob
 import os
+from concurrent.futures import ProcessPoolExecutor
 from tqdm import tqdm
+from can_store import read_dataset, DatasetWriter, BuildCache
+from metric_dataset import ReservoirBalancer
+from can_features import PayloadFeatureCache, InterArrivalTracker, WindowStats, BitFlipTracker, ReplayDetector, decode_payload
+
+FEATURE_SPEC_VERSION = 2
 
 class CANDataProcessor:
-    def __init__(self):
+    FINAL_COLUMNS = [
+        'arbitration_id', 'inter_arrival_time', 'mean_delta_T', 
+        'entropy_ID', 'bit_flipping_rate', 'bit_flips', 'data_entropy', 'label'
+    ]
+
+    def __init__(self, cache_size=1 << 16, window=1000, window_seconds=None, replay_ratio=0.5, build_cache_dir=None):
         self.processed_count = 0
+        # Một frame bị coi là replay nếu cùng (ID, payload) xuất hiện lại sớm hơn replay_ratio lần chu kỳ của ID đó
+        self.replay_ratio = replay_ratio
+        # Cửa sổ trượt cho mean_delta_T, var_delta_T, entropy_ID: số frame hoặc số giây
+        self.window = window
+        self.window_seconds = window_seconds
+        # Payload lặp lại rất nhiều, chỉ tính đặc trưng một lần cho mỗi payload
+        self.feature_cache = PayloadFeatureCache(cache_size)
+        # File capture không đổi nội dung (và cùng tham số) thì dùng lại đặc trưng đã tính
+        self.build_cache = None
+        if build_cache_dir:
+            spec = f"v4-{FEATURE_SPEC_VERSION}-w{window}-s{window_seconds}-r{replay_ratio}"
+            self.build_cache = BuildCache(build_cache_dir, spec)
         
-    def calculate_entropy(self, hex_data):
-        """Tính toán entropy cho chuỗi hex"""
-        if pd.isna(hex_data) or not isinstance(hex_data, str) or len(hex_data) % 2 != 0:
-            return 0.0
-        
-        try:
-            byte_values = [hex_data[i:i+2] for i in range(0, len(hex_data), 2)]
-            byte_counts = Counter(byte_values)
-            total_bytes = len(byte_values)
-            probabilities = [count / total_bytes for count in byte_counts.values()]
-            return round(-sum(p * np.log2(p) for p in probabilities if p > 0), 3)
-        except Exception:
-            return 0.0
-
     def preprocess_dataframe(self, df):
         """Tiền xử lý dataframe"""
         # Chuyển đổi arbitration_id
@@ -30,94 +38,106 @@ class CANDataProcessor:
         
         # Tính toán thời gian
         df["timestamp"] = pd.to_numeric(df["timestamp"], errors="coerce").fillna(0)
-        df["inter_arrival_time"] = df.groupby("arbitration_id")["timestamp"].diff().fillna(0).round(6)
-        
-        # Thêm đặc trưng thống kê
-        df['mean_delta_T'] = df['inter_arrival_time'].mean()
-        df['var_delta_T'] = df['inter_arrival_time'].var(ddof=0)
+        df["inter_arrival_time"] = InterArrivalTracker(decimals=6).update_many(df["arbitration_id"], df["timestamp"])
         
-        # Tính entropy ID
-        id_counts = df['arbitration_id'].value_counts(normalize=True)
-        df['entropy_ID'] = -sum(p * np.log2(p) for p in id_counts if p > 0)
+        # Thêm đặc trưng thống kê và entropy ID theo cửa sổ trượt, giá trị riêng cho từng dòng
+        window_stats = WindowStats(self.window, self.window_seconds)
+        df['mean_delta_T'], df['var_delta_T'], df['entropy_ID'] = window_stats.update_many(
+            df['arbitration_id'], df['timestamp'], df['inter_arrival_time'])
         
         # Phát hiện tấn công
         df['flooding_attack'] = (df['inter_arrival_time'] < 0.001).astype(int)
-        df['replay_attack'] = df.duplicated(subset=['arbitration_id', 'data_field'], keep=False).astype(int)
         
-        # Tính bit flipping rate
-        df['bit_flipping_rate'] = df['data_field'].apply(self._calc_bit_flipping).round(4)
+        # Tính các đặc trưng theo payload (entropy, bit flipping rate, dls) qua cache
+        features = self.feature_cache.features(df['data_field'])
+        df['bit_flipping_rate'] = np.round(features['bit_flipping_rate'], 4)
+        df['data_entropy'] = np.round(features['data_entropy'], 3)
+        df['dls'] = features['dls']
+
+        # Số bit bị lật so với payload trước đó của cùng ID (khoảng cách Hamming)
+        payload, length = decode_payload(df['data_field'])
+        df['bit_flips'] = BitFlipTracker().update_many(df['arbitration_id'], payload)
+
+        # Phát hiện replay theo chu kỳ riêng của từng ID, ID gửi payload cố định đúng chu kỳ không bị gắn cờ
+        df['replay_attack'] = ReplayDetector(self.replay_ratio).update_many(
+            df['arbitration_id'], payload, length, df['timestamp']).astype(int)
         
         return df
 
-    def _calc_bit_flipping(self, x):
-        """Hàm helper tính bit flipping rate"""
-        if not isinstance(x, str):
-            return 0.0
-        try:
-            bits = sum(bin(int(x[i:i+2], 16)).count('1') for i in range(0, len(x), 2) if x[i:i+2].isalnum())
-            return bits / (len(x) * 4)
-        except:
-            return 0.0
-
-    def balance_dataset(self, df):
-        """Cân bằng dataset để giảm overfitting"""
-        try:
-            class_0 = df[df['label'] == 0]
-            class_1 = df[df['label'] == 1]
-            if len(class_0) > len(class_1):
-                class_0 = class_0.sample(len(class_1), random_state=42)
-            else:
-                class_1 = class_1.sample(len(class_0), random_state=42)
-            return pd.concat([class_0, class_1], ignore_index=True)
-        except Exception as e:
-            print(f"[!] Lỗi khi cân bằng dataset: {str(e)}")
-            return df
+    def build_features(self, file):
+        """Đặc trưng của một file capture, chỉ giữ các cột đầu ra (chưa gán label)"""
+        df = self.preprocess_dataframe(read_dataset(file))
+        return df[self.FINAL_COLUMNS[:-1]]
+
+    def load_features(self, file):
+        if self.build_cache is None:
+            return self.build_features(file)
+        return self.build_cache.get_or_build(file, self.build_features)
+
+    def balance_dataset(self, frames, capacity=1 << 22):
+        """Cân bằng dataset có cả hai label, lấy mẫu reservoir 50/50 qua từng dataframe.
+
+        Mỗi label giữ tối đa `capacity` dòng trong reservoir, nên label nhiều
+        dòng hơn thế cũng chỉ còn `capacity` mẫu ngẫu nhiên.
+        """
+        balancer = ReservoirBalancer('label', {0: 0.5, 1: 0.5}, capacity=capacity)
+        for df in frames:
+            balancer.update(df)
+        return balancer.result(shuffle=False)
+
+    def build_unit(self, file_list, label, progress=True):
+        """Xử lý một nhóm file cùng label.
+
+        Cả nhóm chỉ có một label nên không có gì để cân bằng: mọi dòng được
+        giữ lại (balance_dataset chỉ dùng cho dữ liệu trộn nhiều label). Trả về (dataframe, số file đã xử lý, số mẫu đã xử lý); không ghi gì ra
+        đĩa nên có thể chạy song song trong process pool.
+        """
+        processed_files = 0
+        processed_rows = 0
+
+        def processed_frames():
+            nonlocal processed_files, processed_rows
+            files = tqdm(file_list, desc=f"Đang xử lý {'bình thường' if label == 0 else 'tấn công'}") if progress else file_list
+            for file in files:
+                try:
+                    df = self.load_features(file).copy()
+                    df['label'] = label  # Gán label (0 cho bình thường, 1 cho tấn công)
+                    processed_rows += len(df)
+                    processed_files += 1
+                    yield df
+                except Exception as e:
+                    print(f"[!] Lỗi khi xử lý {os.path.basename(file)}: {str(e)}")
+                    continue
+
+        frames = list(processed_frames())
+        result_df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=self.FINAL_COLUMNS)
+        return result_df, processed_files, processed_rows
+
+    def write_unit(self, unit, label, output_file, mode='append'):
+        """Ghi kết quả của build_unit vào output"""
+        result_df, processed_files, processed_rows = unit
+        self.processed_count += processed_rows
+        if not processed_files:
+            print(f"[!] Không có dữ liệu nào được xử lý cho label {label}")
+            return False
+
+        # mode 'append': ghi nối tiếp vào output thay vì đọc lại toàn bộ file
+        with DatasetWriter(output_file, append=(mode == 'append')) as writer:
+            writer.write(result_df)
+        print(f"[✓] Đã xử lý xong {processed_files} file, tổng {writer.rows} mẫu (label: {label})")
+        return True
 
     def process_files(self, file_list, label, output_file, mode='append'):
         """Xử lý danh sách file"""
         if not file_list:
             print(f"[!] Không tìm thấy file cho label {label}")
             return False
+        return self.write_unit(self.build_unit(file_list, label), label, output_file, mode)
 
-        processed_dfs = []
-        for file in tqdm(file_list, desc=f"Đang xử lý {'bình thường' if label == 0 else 'tấn công'}"):
-            try:
-                df = pd.read_csv(file)
-                df = self.preprocess_dataframe(df)
-                df["data_entropy"] = df["data_field"].apply(self.calculate_entropy)
-                df['dls'] = df['data_field'].str.len() // 2
-                df['label'] = label  # Gán label (0 cho bình thường, 1 cho tấn công)
-                processed_dfs.append(df)
-                self.processed_count += len(df)
-            except Exception as e:
-                print(f"[!] Lỗi khi xử lý {os.path.basename(file)}: {str(e)}")
-                continue
-
-        if not processed_dfs:
-            print(f"[!] Không có dữ liệu nào được xử lý cho label {label}")
-            return False
-
-        result_df = pd.concat(processed_dfs, ignore_index=True)
-        result_df = self.balance_dataset(result_df)  # Balance the dataset
-
-        final_columns = [
-            'arbitration_id', 'inter_arrival_time', 'mean_delta_T', 
-            'entropy_ID', 'bit_flipping_rate', 'data_entropy', 'label'
-        ]
-        result_df = result_df[final_columns]
-
-        if mode == 'append' and os.path.exists(output_file):
-            existing_df = pd.read_csv(output_file)
-            result_df = pd.concat([existing_df, result_df], ignore_index=True)
 
-        result_df.to_csv(output_file, index=False)
-        print(f"[✓] Đã xử lý xong {len(processed_dfs)} file, tổng {len(result_df)} mẫu (label: {label})")
-        return True
-
-
-def main():
+def main(parallel=True, workers=None):
     print("=== BẮT ĐẦU XỬ LÝ DỮ LIỆU CAN ===")
-    processor = CANDataProcessor()
+    processor = CANDataProcessor(build_cache_dir="src/datasets_release/.build_cache")
     
     config = {
         "normal_path": {
@@ -165,24 +185,26 @@ def main():
         "output_file": "can_data_processed.csv"
     }
 
-    # Xử lý dữ liệu bình thường (label = 0)
-    normal_files = glob.glob(config["normal_path"]["path"])
-    if normal_files:
-        print("\n[+] Đang xử lý dữ liệu bình thường (label=0)...")
-        processor.process_files(normal_files, 
-                              config["normal_path"]["label"], 
-                              config["output_file"], 
-                              'overwrite')
-
-    # Xử lý dữ liệu tấn công (label = 1)
+    # Mỗi nhóm (tên, danh sách file, label); nhóm bình thường ghi đè output, các nhóm tấn công ghi nối tiếp
+    units = [("bình thường", glob.glob(config["normal_path"]["path"]), config["normal_path"]["label"])]
     for attack_name, attack_config in config["attack_paths"].items():
-        attack_files = glob.glob(attack_config["path"])
-        if attack_files:
-            print(f"\n[+] Đang xử lý tấn công {attack_name} (label=1)...")
-            processor.process_files(attack_files, 
-                                  attack_config["label"], 
-                                  config["output_file"], 
-                                  'append')
+        units.append((attack_name, glob.glob(attack_config["path"]), attack_config["label"]))
+    units = [unit for unit in units if unit[1]]
+
+    if parallel:
+        if processor.build_cache is not None:
+            processor.build_cache.prime([file for _, files, _ in units for file in files])
+        # Các nhóm độc lập nhau: xử lý song song, rồi ghi theo đúng thứ tự cố định ở trên
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(processor.build_unit, files, label, False) for _, files, label in units]
+            results = (future.result() for future in futures)
+            for i, ((name, _, label), result) in enumerate(zip(units, results)):
+                print(f"\n[+] Ghi kết quả {name} (label={label})...")
+                processor.write_unit(result, label, config["output_file"], 'overwrite' if i == 0 else 'append')
+    else:
+        for i, (name, files, label) in enumerate(units):
+            print(f"\n[+] Đang xử lý {name} (label={label})...")
+            processor.process_files(files, label, config["output_file"], 'overwrite' if i == 0 else 'append')
 
     print(f"\n=== HOÀN THÀNH ===\nTổng số mẫu đã xử lý: {processor.processed_count}")
     print(f"Kết quả đã được lưu tại: {config['output_file']}")
@@ -0,0 +1,83 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import changeDataset
+import convertToCSV2
+from can_reader import raw_log_format
+
+# Log format -> matching parse_can_log
+CONVERTERS = {
+    "candump": changeDataset.parse_can_log,
+    "timestamp": convertToCSV2.parse_can_log,
+}
+
+
+def collect_log_files(source, pattern="*.log"):
+    """Expand a directory, a glob or a list of paths into a sorted list of log files"""
+    if isinstance(source, (list, tuple)):
+        return list(source)
+    if os.path.isdir(source):
+        return sorted(glob.glob(os.path.join(source, pattern)))
+    return sorted(glob.glob(source))
+
+
+def output_path_for(log_file, output_dir=None, prefix="can-data-v6-"):
+    stem = os.path.splitext(os.path.basename(log_file))[0]
+    return os.path.join(output_dir or os.path.dirname(log_file), f"{prefix}{stem}.csv")
+
+
+def _convert_one(fmt, log_file, csv_file, label=None):
+    start = time.perf_counter()
+    # CSV captures (already converted) raise ValueError here instead of a KeyError below
+    fmt = raw_log_format(log_file, None if fmt == "auto" else fmt)
+    # label=None keeps each converter's own default label
+    kwargs = {} if label is None else {"label": label}
+    frames = CONVERTERS[fmt](log_file, csv_file, **kwargs)
+    return log_file, csv_file, frames, time.perf_counter() - start
+
+
+def convert_logs(source, output_dir=None, fmt="auto", workers=None, prefix="can-data-v6-", label=None):
+    """Convert every log in `source` to CSV on a process pool, one file per task"""
+    log_files = collect_log_files(source)
+    if not log_files:
+        print(f"No log file found in: {source}")
+        return []
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    results = []
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_convert_one, fmt, f, output_path_for(f, output_dir, prefix), label)
+                   for f in log_files]
+        for future in as_completed(futures):
+            try:
+                log_file, csv_file, frames, elapsed = future.result()
+            except ValueError as e:
+                print(f"Skipped: {e}")
+                continue
+            rate = frames / elapsed if elapsed > 0 else 0.0
+            print(f"{os.path.basename(log_file)}: {frames} frames in {elapsed:.2f}s ({rate:,.0f} frames/s)")
+            results.append((log_file, csv_file, frames, elapsed))
+    wall_time = time.perf_counter() - start
+
+    total_frames = sum(r[2] for r in results)
+    print(f"Converted {len(results)} files, {total_frames} frames, wall time: {wall_time:.2f}s "
+          f"({total_frames / wall_time if wall_time > 0 else 0:,.0f} frames/s)")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batch convert CAN logs to CSV on a process pool")
+    parser.add_argument("source", help="directory of .log files or a glob pattern")
+    parser.add_argument("-o", "--output-dir", default=None)
+    parser.add_argument("-f", "--format", default="auto", choices=["auto"] + sorted(CONVERTERS))
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--prefix", default="can-data-v6-")
+    parser.add_argument("-l", "--label", type=int, default=None,
+                        help="label written on every frame (default: the converter's own default)")
+    args = parser.parse_args()
+    convert_logs(args.source, args.output_dir, args.format, args.workers, args.prefix, args.label)
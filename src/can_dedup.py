@@ -0,0 +1,155 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from can_store import DatasetWriter, is_columnar, is_sharded, iter_dataset, DEFAULT_BLOCK_ROWS
+
+# Bookkeeping columns added to every spilled row
+SOURCE_COLUMN = "_source"
+ORDER_COLUMN = "_order"
+
+
+def iter_text_blocks(path, chunksize):
+    # Rows are compared by their text, so every block of every file hashes the same way
+    # whatever dtype pandas would infer for it
+    if is_columnar(path) or is_sharded(path):
+        for df in iter_dataset(path, chunksize):
+            yield df.astype(str)
+        return
+    yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+def shared_columns(sources):
+    """Union of the column names of every source, in order of first appearance"""
+    columns = {}
+    for path in sources:
+        if is_columnar(path) or is_sharded(path):
+            first = next(iter_dataset(path, 1), None)
+            names = [] if first is None else first.columns
+        else:
+            names = pd.read_csv(path, nrows=0).columns
+        columns.update(dict.fromkeys(names))
+    return list(columns)
+
+
+def canonical_block(df, columns):
+    """Text block -> block over `columns` with one spelling per number.
+
+    Missing columns become empty cells. Cells written as decimals or signed
+    numbers ("1.0", "2.50", "-0.0", "1e-05") are rewritten canonically, so
+    "1" and "1.0" compare equal as with parsed values. Cells without ".",
+    "+" or "-" are left alone: they may be hex, where "00" and "0000" or
+    "0100" and "100" are different payloads and IDs.
+    """
+    df = df.reindex(columns=columns, fill_value="").reset_index(drop=True)
+    for name in columns:
+        text = df[name].astype(str)
+        numeric = text.str.contains(r"[.+\-]", regex=True)
+        if not numeric.any():
+            continue
+        values = pd.to_numeric(text[numeric], errors="coerce").to_numpy(dtype=np.float64)
+        rows = numeric[numeric].index[~np.isnan(values)]
+        values = values[~np.isnan(values)]
+        integral = np.isfinite(values) & (np.abs(values) < 2 ** 53)
+        integral[integral] = values[integral] == np.floor(values[integral])
+        ints = np.zeros(len(values), dtype=np.int64)
+        ints[integral] = values[integral]
+        text.loc[rows] = np.where(integral, ints.astype(str), values.astype(str))
+        df[name] = text
+    return df
+
+
+def _spill(sources, spill_dir, partitions, chunksize, within_source, columns):
+    """Hash every row into one of `partitions` CSV files; returns rows per source"""
+    writers = [DatasetWriter(os.path.join(spill_dir, f"part-{i:04d}.csv")) for i in range(partitions)]
+    source_rows = []
+    order = 0
+    try:
+        for source_id, path in enumerate(sources):
+            rows = 0
+            for df in iter_text_blocks(path, chunksize):
+                # Same columns and value spelling for every source, so rows hash by value
+                df = canonical_block(df, columns)
+                hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+                if within_source:
+                    hashes = hashes ^ np.uint64(source_id)
+                df[SOURCE_COLUMN] = source_id
+                df[ORDER_COLUMN] = np.arange(order, order + len(df), dtype=np.int64)
+                part = hashes % np.uint64(partitions)
+                for i in np.unique(part):
+                    writers[i].write(df[part == i])
+                order += len(df)
+                rows += len(df)
+            source_rows.append(rows)
+    finally:
+        for writer in writers:
+            writer.close()
+    return source_rows
+
+
+def _dedup_partition(part_path, n_sources, within_source):
+    """Global order of the rows in one partition that repeat an earlier row"""
+    if os.path.getsize(part_path) == 0:
+        return np.empty(0, dtype=np.int64), np.zeros(n_sources, dtype=np.int64)
+    df = pd.read_csv(part_path, dtype=str, keep_default_na=False)
+    df[SOURCE_COLUMN] = df[SOURCE_COLUMN].astype(np.int64)
+    df[ORDER_COLUMN] = df[ORDER_COLUMN].astype(np.int64)
+    df = df.sort_values(ORDER_COLUMN, kind="stable")
+    subset = [c for c in df.columns if c != ORDER_COLUMN and (within_source or c != SOURCE_COLUMN)]
+    duplicated = df.duplicated(subset=subset).to_numpy()
+    dup_sources = df[SOURCE_COLUMN].to_numpy()[duplicated]
+    return df[ORDER_COLUMN].to_numpy()[duplicated], np.bincount(dup_sources, minlength=n_sources)
+
+
+def external_dedup(sources, output=None, partitions=16, workers=None, within_source=False,
+                   chunksize=DEFAULT_BLOCK_ROWS, tmp_dir=None):
+    """Out-of-core duplicate detection over one or many datasets.
+
+    Rows are hashed and spilled to `partitions` files, so only one partition
+    (about 1/partitions of the data) is ever in memory; partitions are checked
+    in parallel. A row is a duplicate if it repeats an earlier row of any
+    source, or of its own source with `within_source`. Rows are compared by
+    value over the union of the sources' columns, whatever their order. When `output` is set,
+    the sources are streamed once more into it without the duplicates, in
+    their original order.
+
+    Returns {"rows", "duplicates", "per_source": {path: (rows, duplicates)}}.
+    """
+    if isinstance(sources, str):
+        sources = [sources]
+    spill_dir = tempfile.mkdtemp(prefix="dedup-", dir=tmp_dir)
+    try:
+        columns = shared_columns(sources)
+        source_rows = _spill(sources, spill_dir, partitions, chunksize, within_source, columns)
+        part_paths = [os.path.join(spill_dir, f"part-{i:04d}.csv") for i in range(partitions)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_dedup_partition, part_paths,
+                                        [len(sources)] * partitions, [within_source] * partitions))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    dup_orders = np.sort(np.concatenate([orders for orders, _ in results]))
+    dup_counts = np.sum([counts for _, counts in results], axis=0)
+
+    if output is not None:
+        with DatasetWriter(output) as writer:
+            start = 0
+            for path in sources:
+                # CSV -> CSV keeps the original text of every kept row
+                text = not (is_columnar(output) or is_columnar(path) or is_sharded(path))
+                blocks = iter_text_blocks(path, chunksize) if text else iter_dataset(path, chunksize)
+                for df in blocks:
+                    keep = ~np.isin(np.arange(start, start + len(df)), dup_orders, assume_unique=True)
+                    # Sources with other or reordered columns are aligned on the shared column list
+                    writer.write(df[keep].reindex(columns=columns), source=path)
+                    start += len(df)
+
+    return {
+        "rows": int(sum(source_rows)),
+        "duplicates": int(len(dup_orders)),
+        "per_source": {path: (int(rows), int(dups)) for path, rows, dups in zip(sources, source_rows, dup_counts)},
+    }
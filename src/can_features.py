@@ -0,0 +1,567 @@
+import math
+import statistics
+from collections import OrderedDict, deque
+import numpy as np
+import pandas as pd
+
+PAYLOAD_WIDTH = 8
+
+# ASCII -> nibble value; 0xFF marks a non-hex character
+_HEX_LUT = np.full(256, 0xFF, dtype=np.uint8)
+for _i, _c in enumerate(b"0123456789abcdef"):
+    _HEX_LUT[_c] = _i
+for _i, _c in enumerate(b"ABCDEF"):
+    _HEX_LUT[_c] = 10 + _i
+
+# Number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _hex_matrix(values):
+    """Hex strings -> (N, 16) ASCII byte matrix and the number of hex digits per row.
+
+    Spaces are dropped. A payload with a non-hex character or more than
+    PAYLOAD_WIDTH bytes raises ValueError.
+    """
+    values = np.array(values, dtype=object)
+    values[pd.isna(values)] = ""
+    if len(values) == 0:
+        # reshape(0, -1) cannot infer the width of an empty matrix
+        return np.empty((0, 2 * PAYLOAD_WIDTH), dtype=np.uint8), np.zeros(0, dtype=np.int64)
+    # One spare column beyond the longest spaced payload, so longer rows are caught, not truncated
+    width = f"S{4 * PAYLOAD_WIDTH + 1}"
+    try:
+        chars = np.asarray(values, dtype=width).view(np.uint8).reshape(len(values), -1)
+    except UnicodeEncodeError:
+        bad = next(value for value in values if not str(value).isascii())
+        raise ValueError(f"data_field is not hex: {bad!r}") from None
+
+    spaced = (chars == ord(" ")).any(axis=1)
+    if spaced.any():
+        # Rare "0A 1B ..." rows: drop the separators before the fixed-width view
+        stripped = np.asarray([str(v).replace(" ", "") for v in values[spaced]], dtype=width)
+        chars[spaced] = stripped.view(np.uint8).reshape(len(stripped), -1)
+    nibbles = np.count_nonzero(chars, axis=1)
+    too_long = nibbles > 2 * PAYLOAD_WIDTH
+    if too_long.any():
+        raise ValueError(f"data_field is longer than {PAYLOAD_WIDTH} bytes: {values[np.argmax(too_long)]!r}")
+    chars = chars[:, :2 * PAYLOAD_WIDTH]
+    invalid = ((_HEX_LUT[chars] == 0xFF) & (chars != 0)).any(axis=1)
+    if invalid.any():
+        raise ValueError(f"data_field is not hex: {values[np.argmax(invalid)]!r}")
+    return chars, nibbles
+
+
+def _decode(values):
+    if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+        # Dictionary-encoded column: decode each distinct payload once, expand by code
+        categorical = values.array if isinstance(values, pd.Series) else values
+        payload, length, nibbles, ones = _decode(np.append(np.asarray(categorical.categories, dtype=object), ""))
+        codes = np.where(categorical.codes < 0, len(categorical.categories), categorical.codes)
+        return payload[codes], length[codes], nibbles[codes], ones[codes]
+
+    chars, nibbles = _hex_matrix(values)
+    digits = _HEX_LUT[chars]
+    length = (nibbles // 2).astype(np.uint8)
+    # Set bits over every hex digit, including the trailing nibble of an odd-length payload
+    ones = POPCOUNT[np.where(np.arange(2 * PAYLOAD_WIDTH) < nibbles[:, None], digits, 0)].sum(axis=1, dtype=np.int64)
+
+    payload = (digits[:, 0::2] << 4) | (digits[:, 1::2] & 0x0F)
+    payload[np.arange(PAYLOAD_WIDTH) >= length[:, None]] = 0
+    return payload.astype(np.uint8), length, nibbles, ones
+
+
+def decode_payload(values):
+    """Decode a whole `data_field` column in one pass.
+
+    Returns a zero-padded (N, 8) uint8 payload matrix and the payload length
+    in bytes, i.e. `len(str(x).replace(" ", "")) // 2` per row. Missing values
+    decode to an empty payload; non-hex or longer than 8-byte payloads raise
+    ValueError.
+    """
+    payload, length, _, _ = _decode(values)
+    return payload, length
+
+
+def bit_flip_rate(ones, nibbles):
+    """Share of set bits over the `nibbles * 4` payload bits, the old _calc_bit_flipping.
+
+    `ones` counts the set bits of every hex digit (as _decode does), so an
+    odd trailing nibble counts like in the old per-pair loop.
+    """
+    nibbles = np.asarray(nibbles)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(nibbles > 0, ones / (nibbles * 4), 0.0)
+
+
+def payload_to_int(payload, length):
+    """Big-endian integer value of each payload, the vectorized `int(data_field, 16)`"""
+    value = np.ascontiguousarray(payload, dtype=np.uint8).view(">u8").ravel().astype(np.uint64)
+    shift = np.where(length > 0, 8 * (PAYLOAD_WIDTH - length.astype(np.uint64)), 0).astype(np.uint64)
+    return np.where(length > 0, value >> shift, 0).astype(np.uint64)
+
+
+def _count_partitions(n, largest=None):
+    if n == 0:
+        yield ()
+        return
+    for k in range(min(n, largest or n), 0, -1):
+        for rest in _count_partitions(n - k, k):
+            yield (k,) + rest
+
+
+def _build_entropy_table():
+    # With at most 8 bytes per frame, a row's entropy only depends on the
+    # multiset of its byte counts, i.e. on one of the 66 partitions of 1..8.
+    # Each partition is keyed by sum(9 ** (count - 1)) over the row's bytes
+    # (at most 8 bytes share a count, so the base-9 digits never carry) and
+    # its entropy is evaluated once with the reference formula.
+    table = {0: 0.0}
+    for n in range(1, PAYLOAD_WIDTH + 1):
+        for counts in _count_partitions(n):
+            key = sum(c * 9 ** (c - 1) for c in counts)
+            table[key] = -sum((c / n) * math.log2(c / n) for c in counts)
+    keys = np.array(sorted(table), dtype=np.int64)
+    return keys, np.array([table[k] for k in keys], dtype=np.float64)
+
+
+_ENTROPY_KEYS, _ENTROPY_VALUES = _build_entropy_table()
+_POW9 = 9 ** np.arange(PAYLOAD_WIDTH + 1, dtype=np.int64)
+_BLOCK_ROWS = 1 << 16
+
+
+def payload_entropy(payload, length, decimals=None):
+    """Shannon entropy (bits) of each payload row over its first `length` bytes.
+
+    Gives the same values as the per-row `calculate_entropy` helpers followed
+    by `round(x, decimals)`, for millions of rows per second.
+    """
+    table = _ENTROPY_VALUES if decimals is None else np.array([round(v, decimals) for v in _ENTROPY_VALUES])
+    length = np.asarray(length)
+    result = np.empty(len(length), dtype=np.float64)
+    columns = np.arange(PAYLOAD_WIDTH)
+
+    for start in range(0, len(length), _BLOCK_ROWS):
+        block = np.asarray(payload[start:start + _BLOCK_ROWS], dtype=np.int16)
+        valid = columns < length[start:start + _BLOCK_ROWS, None]
+        # Padding bytes get distinct negative values so they never match real bytes
+        block = np.where(valid, block, -1 - columns)
+        counts = (block[:, :, None] == block[:, None, :]).sum(axis=2)
+        keys = np.where(valid, _POW9[counts - 1], 0).sum(axis=1)
+        result[start:start + len(keys)] = table[np.searchsorted(_ENTROPY_KEYS, keys)]
+    return result
+
+
+def data_field_entropy(values, decimals=None):
+    """Entropy of a `data_field` hex column; missing or odd-length payloads give 0"""
+    payload, length, nibbles, _ = _decode(values)
+    entropy = payload_entropy(payload, length, decimals)
+    entropy[nibbles % 2 == 1] = 0.0
+    return entropy
+
+
+PAYLOAD_FEATURES = ("data_entropy", "bit_flipping_rate", "dls")
+# dls of a missing payload, as the old len(str(x).replace(" ", "")) // 2 gave for NaN
+MISSING_DLS = 1
+
+
+def payload_features(values):
+    """Unrounded per-payload features of a `data_field` column, as in CANDataProcessor"""
+    payload, length, nibbles, ones = _decode(values)
+    entropy = payload_entropy(payload, length)
+    entropy[nibbles % 2 == 1] = 0.0
+    dls = np.where(pd.isna(np.array(values, dtype=object)), MISSING_DLS, length).astype(np.uint8)
+    return {"data_entropy": entropy, "bit_flipping_rate": bit_flip_rate(ones, nibbles), "dls": dls}
+
+
+class PayloadFeatureCache:
+    """Bounded LRU cache of payload-derived features keyed by the raw payload string"""
+
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def lookup(self, data_field):
+        """Features of one frame, as a tuple ordered like PAYLOAD_FEATURES"""
+        entry = self._entries.get(data_field)
+        if entry is not None:
+            self._entries.move_to_end(data_field)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        computed = payload_features([data_field])
+        entry = tuple(float(computed[name][0]) for name in PAYLOAD_FEATURES)
+        self._store(data_field, entry)
+        return entry
+
+    def features(self, values):
+        """Features of a whole column; each distinct payload costs one dict lookup"""
+        codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+        uniques = np.asarray(uniques, dtype=object)
+        table = np.zeros((len(uniques) + 1, len(PAYLOAD_FEATURES)), dtype=np.float64)
+        table[-1, PAYLOAD_FEATURES.index("dls")] = MISSING_DLS
+
+        missing = []
+        for i, key in enumerate(uniques):
+            entry = self._entries.get(key)
+            if entry is None:
+                missing.append(i)
+            else:
+                self._entries.move_to_end(key)
+                table[i] = entry
+        if missing:
+            computed = payload_features(uniques[missing])
+            table[missing] = np.column_stack([computed[name] for name in PAYLOAD_FEATURES])
+            for i in missing:
+                self._store(uniques[i], tuple(table[i].tolist()))
+
+        self.misses += len(missing)
+        self.hits += len(codes) - len(missing)
+        # Code -1 (missing payload) picks the last row: zero features, MISSING_DLS
+        rows = table[codes]
+        return {
+            "data_entropy": rows[:, 0],
+            "bit_flipping_rate": rows[:, 1],
+            "dls": rows[:, 2].astype(np.uint8),
+        }
+
+
+# Standard (11-bit) CAN identifiers
+ID_SPACE = 2048
+
+
+class _IdSlots:
+    """Row of a per-ID state table for every arbitration ID.
+
+    IDs in [0, id_space) use their own row. Any other ID (29-bit extended
+    IDs, negative values) gets an extra row past `id_space` the first time it
+    is seen. A missing ID (NaN, None) maps to -1 and carries no state, as
+    groupby() drops NaN keys.
+    """
+
+    def __init__(self, id_space):
+        self.id_space = id_space
+        self.extra = {}
+
+    @property
+    def size(self):
+        return self.id_space + len(self.extra)
+
+    def slot(self, arbitration_id):
+        if arbitration_id is None or arbitration_id != arbitration_id:
+            return -1
+        arbitration_id = int(arbitration_id)
+        if 0 <= arbitration_id < self.id_space:
+            return arbitration_id
+        return self.extra.setdefault(arbitration_id, self.id_space + len(self.extra))
+
+    def slots(self, arbitration_ids):
+        ids = np.asarray(arbitration_ids)
+        missing = None
+        if ids.dtype.kind not in "iu":
+            values = pd.to_numeric(pd.Series(ids), errors="coerce").to_numpy(dtype=np.float64)
+            missing = np.isnan(values)
+            ids = np.where(missing, -1, values)
+        slots = ids.astype(np.int64)
+        outside = (slots < 0) | (slots >= self.id_space)
+        if missing is not None:
+            outside &= ~missing
+        if outside.any():
+            uniques, inverse = np.unique(slots[outside], return_inverse=True)
+            rows = [self.extra.setdefault(value, self.id_space + len(self.extra)) for value in uniques.tolist()]
+            slots[outside] = np.array(rows, dtype=np.int64)[inverse]
+        if missing is not None:
+            slots[missing] = -1
+        return slots
+
+
+def _grown(table, size, fill):
+    """`table` with at least `size` rows, new rows set to `fill`; doubles to keep growth amortized"""
+    if len(table) >= size:
+        return table
+    grown = np.full((max(size, 2 * len(table)),) + table.shape[1:], fill, dtype=table.dtype)
+    grown[:len(table)] = table
+    return grown
+
+
+class InterArrivalTracker:
+    """Per-ID inter-arrival time, updated in O(1) per frame over a fixed ID table.
+
+    Matches `df.groupby("arbitration_id")["timestamp"].diff().fillna(0).round(decimals)`
+    when fed the frames of a file in order, and keeps working on unbounded streams.
+    IDs outside the standard 11-bit table get extra rows; missing IDs give 0.
+    """
+
+    def __init__(self, id_space=ID_SPACE, decimals=6):
+        self.id_space = id_space
+        self.decimals = decimals
+        self._ids = _IdSlots(id_space)
+        self.last_seen = np.full(id_space, np.nan)
+
+    def reset(self):
+        self.last_seen.fill(np.nan)
+
+    def update(self, arbitration_id, timestamp):
+        """Inter-arrival time of one incoming frame"""
+        slot = self._ids.slot(arbitration_id)
+        if slot < 0:
+            return 0.0
+        self.last_seen = _grown(self.last_seen, self._ids.size, np.nan)
+        last = self.last_seen[slot]
+        self.last_seen[slot] = timestamp
+        delta = 0.0 if np.isnan(last) else timestamp - last
+        return float(np.round(delta, self.decimals))
+
+    def update_many(self, arbitration_ids, timestamps):
+        """Inter-arrival times of a batch of frames, same result as calling update() per row"""
+        slots = self._ids.slots(arbitration_ids)
+        ts = np.asarray(timestamps, dtype=np.float64)
+        result = np.zeros(len(slots), dtype=np.float64)
+        valid = np.flatnonzero(slots >= 0)
+        if not len(valid):
+            return result
+        self.last_seen = _grown(self.last_seen, self._ids.size, np.nan)
+        ids = slots[valid]
+
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        sorted_ts = ts[valid][order]
+        starts = np.ones(len(ids), dtype=bool)
+        starts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        ends = np.ones(len(ids), dtype=bool)
+        ends[:-1] = starts[1:]
+
+        previous = np.empty_like(sorted_ts)
+        previous[1:] = sorted_ts[:-1]
+        previous[starts] = self.last_seen[sorted_ids[starts]]
+        delta = sorted_ts - previous
+        delta[np.isnan(previous)] = 0.0
+        self.last_seen[sorted_ids[ends]] = sorted_ts[ends]
+
+        result[valid[order]] = delta
+        return np.round(result, self.decimals)
+
+
+def _xlog2x(c):
+    return c * math.log2(c) if c > 0 else 0.0
+
+
+class WindowStats:
+    """Sliding-window mean_delta_T, var_delta_T and entropy_ID, O(1) per frame.
+
+    The window holds the last `window` frames, or the frames of the last
+    `duration` seconds when `duration` is given. Inter-arrival moments use
+    Welford's update (and its inverse on eviction); the ID entropy is kept
+    from running counts as log2(n) - sum(c * log2(c)) / n. IDs are counted in
+    a dict, so extended IDs need no table and missing IDs count as one symbol.
+    """
+
+    def __init__(self, window=1000, duration=None):
+        self.window = window
+        self.duration = duration
+        self._frames = deque()
+        self._n = 0
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._id_counts = {}
+        self._sum_clogc = 0.0
+
+    def _add(self, arbitration_id, delta):
+        self._n += 1
+        d = delta - self._mean
+        self._mean += d / self._n
+        self._m2 += d * (delta - self._mean)
+
+        c = self._id_counts.get(arbitration_id, 0)
+        self._id_counts[arbitration_id] = c + 1
+        self._sum_clogc += _xlog2x(c + 1) - _xlog2x(c)
+
+    def _remove(self, arbitration_id, delta):
+        if self._n == 1:
+            self._n, self._mean, self._m2 = 0, 0.0, 0.0
+        else:
+            self._n -= 1
+            d = delta - self._mean
+            self._mean -= d / self._n
+            self._m2 -= d * (delta - self._mean)
+
+        c = self._id_counts[arbitration_id]
+        if c == 1:
+            del self._id_counts[arbitration_id]
+        else:
+            self._id_counts[arbitration_id] = c - 1
+        self._sum_clogc += _xlog2x(c - 1) - _xlog2x(c)
+
+    def update(self, arbitration_id, timestamp, inter_arrival_time):
+        """Add one frame and return (mean_delta_T, var_delta_T, entropy_ID) over the window"""
+        if arbitration_id is None or arbitration_id != arbitration_id:
+            # NaN never equals itself as a dict key: fold every missing ID into None
+            arbitration_id = None
+        self._frames.append((timestamp, arbitration_id, inter_arrival_time))
+        self._add(arbitration_id, inter_arrival_time)
+
+        if self.duration is None:
+            while len(self._frames) > self.window:
+                _, old_id, old_delta = self._frames.popleft()
+                self._remove(old_id, old_delta)
+        else:
+            while timestamp - self._frames[0][0] > self.duration:
+                _, old_id, old_delta = self._frames.popleft()
+                self._remove(old_id, old_delta)
+
+        n = self._n
+        variance = max(self._m2 / n, 0.0)
+        entropy = max(math.log2(n) - self._sum_clogc / n, 0.0)
+        return self._mean, variance, entropy
+
+    def update_many(self, arbitration_ids, timestamps, inter_arrival_times):
+        """Per-row window statistics of a batch; state carries over to the next batch"""
+        n = len(arbitration_ids)
+        mean = np.empty(n)
+        var = np.empty(n)
+        entropy = np.empty(n)
+        rows = zip(np.asarray(arbitration_ids).tolist(), np.asarray(timestamps, dtype=np.float64).tolist(),
+                   np.asarray(inter_arrival_times, dtype=np.float64).tolist())
+        for i, (arbitration_id, timestamp, delta) in enumerate(rows):
+            mean[i], var[i], entropy[i] = self.update(arbitration_id, timestamp, delta)
+        return mean, var, entropy
+
+
+class BitFlipTracker:
+    """Per-ID Hamming distance between a frame's payload and the previous payload of the same ID.
+
+    The last payload of every ID is kept in an (id_space, 8) table that grows
+    for IDs outside the 11-bit space; the first frame of an ID, and any frame
+    without an ID, gives 0 flipped bits.
+    """
+
+    def __init__(self, id_space=ID_SPACE):
+        self.id_space = id_space
+        self._ids = _IdSlots(id_space)
+        self.last_payload = np.zeros((id_space, PAYLOAD_WIDTH), dtype=np.uint8)
+        self.seen = np.zeros(id_space, dtype=bool)
+
+    def _grow(self):
+        self.last_payload = _grown(self.last_payload, self._ids.size, 0)
+        self.seen = _grown(self.seen, self._ids.size, False)
+
+    def update(self, arbitration_id, payload):
+        """Flipped bits of one incoming frame"""
+        slot = self._ids.slot(arbitration_id)
+        if slot < 0:
+            return 0
+        self._grow()
+        payload = np.asarray(payload, dtype=np.uint8)
+        flips = int(POPCOUNT[payload ^ self.last_payload[slot]].sum()) if self.seen[slot] else 0
+        self.last_payload[slot] = payload
+        self.seen[slot] = True
+        return flips
+
+    def update_many(self, arbitration_ids, payload):
+        """Flipped bits of a batch of frames, same result as calling update() per row"""
+        slots = self._ids.slots(arbitration_ids)
+        result = np.zeros(len(slots), dtype=np.uint8)
+        valid = np.flatnonzero(slots >= 0)
+        if not len(valid):
+            return result
+        self._grow()
+        ids = slots[valid]
+
+        order = np.argsort(ids, kind="stable")
+        sorted_ids = ids[order]
+        sorted_payload = np.asarray(payload, dtype=np.uint8)[valid][order]
+        starts = np.ones(len(ids), dtype=bool)
+        starts[1:] = sorted_ids[1:] != sorted_ids[:-1]
+        ends = np.ones(len(ids), dtype=bool)
+        ends[:-1] = starts[1:]
+
+        previous = np.empty_like(sorted_payload)
+        previous[1:] = sorted_payload[:-1]
+        previous[starts] = self.last_payload[sorted_ids[starts]]
+        flips = POPCOUNT[sorted_payload ^ previous].sum(axis=1, dtype=np.uint8)
+        flips[starts & ~self.seen[sorted_ids]] = 0
+        self.last_payload[sorted_ids[ends]] = sorted_payload[ends]
+        self.seen[sorted_ids[ends]] = True
+
+        result[valid[order]] = flips
+        return result
+
+
+class ReplayDetector:
+    """Flags a frame that repeats a recent (ID, payload) much sooner than the ID's own period.
+
+    Each ID's period is the median of its last `history` inter-arrival
+    times. A frame is a replay when the same fingerprint was seen less than
+    `ratio` periods ago, so a periodic ID sending a constant payload is never
+    flagged whatever its rate; replayed frames are injected between the
+    genuine ones. No frame of an ID is flagged before `min_history` periods
+    are known, and flagged frames do not enter the period estimate.
+    Fingerprints expire after `window` seconds, the longest replay window,
+    so memory is bounded by the frames inside it plus a few numbers per ID.
+    """
+
+    def __init__(self, ratio=0.5, history=16, min_history=4, window=1.0):
+        self.ratio = ratio
+        self.history = history
+        self.min_history = min_history
+        self.window = window
+        self._last_seen = {}
+        self._recent = deque()
+        self._last_arrival = {}
+        self._deltas = {}
+
+    def __len__(self):
+        return len(self._last_seen)
+
+    def _expire(self, now):
+        while self._recent and now - self._recent[0][0] > self.window:
+            timestamp, key = self._recent.popleft()
+            if self._last_seen.get(key) == timestamp:
+                del self._last_seen[key]
+
+    def period(self, arbitration_id):
+        """Median inter-arrival time of `arbitration_id`, None until `min_history` are known"""
+        deltas = self._deltas.get(arbitration_id)
+        if deltas is None or len(deltas) < self.min_history:
+            return None
+        return statistics.median(deltas)
+
+    def update(self, arbitration_id, payload, timestamp):
+        """True if this frame repeats a recent one; `payload` is any hashable payload key"""
+        self._expire(timestamp)
+        key = (arbitration_id, payload)
+        last = self._last_seen.get(key)
+        period = self.period(arbitration_id)
+        replay = (last is not None and period is not None
+                  and timestamp - last < min(self.ratio * period, self.window))
+        if not replay:
+            previous = self._last_arrival.get(arbitration_id)
+            if previous is not None:
+                deltas = self._deltas.get(arbitration_id)
+                if deltas is None:
+                    deltas = self._deltas[arbitration_id] = deque(maxlen=self.history)
+                deltas.append(timestamp - previous)
+            self._last_arrival[arbitration_id] = timestamp
+        self._last_seen[key] = timestamp
+        self._recent.append((timestamp, key))
+        return replay
+
+    def update_many(self, arbitration_ids, payload, length, timestamps):
+        """Replay flags of a batch of decoded frames, in arrival order"""
+        length = np.asarray(length)
+        # (length, big-endian value) identifies a payload exactly, "00" and "0000" included
+        values = payload_to_int(payload, length)
+        rows = zip(np.asarray(arbitration_ids).tolist(), length.tolist(), values.tolist(),
+                   np.asarray(timestamps, dtype=np.float64).tolist())
+        return np.fromiter((self.update(i, (n, value), ts) for i, n, value, ts in rows),
+                           dtype=bool, count=len(length))
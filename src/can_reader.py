@@ -0,0 +1,238 @@
+import mmap
+import os
+import numpy as np
+import pandas as pd
+from can_features import decode_payload
+
+# Classical CAN: at most 8 data bytes per frame
+PAYLOAD_WIDTH = 8
+DEFAULT_CHUNK_SIZE = 1 << 16
+# Sidecar time index: one (byte offset, timestamp) entry every DEFAULT_INDEX_EVERY frames
+DEFAULT_INDEX_EVERY = 4096
+INDEX_SUFFIX = ".idx.npz"
+# CSV captures: hex columns read as text, so "0350" or an all-zero payload is never parsed as a decimal number
+CSV_HEX_DTYPES = {"arbitration_id": str, "data_field": str}
+
+
+def _new_chunk(chunk_size):
+    return {
+        "timestamp": np.empty(chunk_size, dtype=np.float64),
+        "arbitration_id": np.empty(chunk_size, dtype=np.uint32),
+        "payload": np.zeros((chunk_size, PAYLOAD_WIDTH), dtype=np.uint8),
+        "dlc": np.empty(chunk_size, dtype=np.uint8),
+    }
+
+
+def _trim_chunk(chunk, n):
+    return {name: column[:n] for name, column in chunk.items()}
+
+
+def _split_candump(line):
+    """`(1479121434.850202) can0 0350#052884666D0000A2` -> (timestamp, id, data hex, dlc)"""
+    fields = line.split()
+    if len(fields) < 3 or not fields[0].startswith(b"("):
+        return None
+    ident, sep, data = fields[2].partition(b"#")
+    if not sep or not data:
+        return None
+    return float(fields[0][1:-1]), int(ident, 16), data, None
+
+
+def _split_timestamp_log(line):
+    """`Timestamp: 1479121434.850202  ID: 0350  000  DLC: 8  05 28 84 66 6d 00 00 a2` -> (timestamp, id, data hex, dlc)"""
+    fields = line.split()
+    # Only the header is required: a "DLC: 0" frame has no data bytes
+    if len(fields) < 7 or fields[0] != b"Timestamp:" or fields[2] != b"ID:" or fields[5] != b"DLC:":
+        return None
+    dlc = int(fields[6])
+    return float(fields[1]), int(fields[3], 16), b"".join(fields[7:7 + dlc]), dlc
+
+
+LINE_SPLITTERS = {
+    "candump": _split_candump,
+    "timestamp": _split_timestamp_log,
+}
+
+
+def sniff_format(path, max_lines=20):
+    """Guess the log format from its first lines: "candump", "timestamp" or "csv" """
+    with open(path, 'rb') as file:
+        for _, line in zip(range(max_lines), file):
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(b"timestamp,") or b",arbitration_id" in line:
+                return "csv"
+            for fmt, split_line in LINE_SPLITTERS.items():
+                try:
+                    if split_line(line) is not None:
+                        return fmt
+                except ValueError:
+                    pass
+    raise ValueError(f"Unknown CAN log format: {path}")
+
+
+def raw_log_format(path, fmt=None):
+    """Format of a raw text log, "candump" or "timestamp"; CSV captures raise ValueError"""
+    fmt = fmt or sniff_format(path)
+    if fmt not in LINE_SPLITTERS:
+        raise ValueError(f"Not a raw CAN log ({fmt} file): {path}")
+    return fmt
+
+
+def _line_chunks(lines, split_line, chunk_size, until=None):
+    """Parse byte lines into chunks; stop after the first frame later than `until`"""
+    chunk = _new_chunk(chunk_size)
+    n = 0
+    for line in lines:
+        try:
+            frame = split_line(line)
+            if frame is None:
+                continue
+            timestamp, arbitration_id, data_hex, dlc = frame
+            data_hex = data_hex[:2 * PAYLOAD_WIDTH].decode()
+            if len(data_hex) % 2:
+                # An odd trailing nibble is kept as its own byte
+                data_hex = data_hex[:-1] + '0' + data_hex[-1]
+            data = bytes.fromhex(data_hex)
+        except ValueError:
+            continue
+
+        chunk["timestamp"][n] = timestamp
+        chunk["arbitration_id"][n] = arbitration_id
+        chunk["payload"][n, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        chunk["dlc"][n] = len(data) if dlc is None else dlc
+        n += 1
+
+        if until is not None and timestamp > until:
+            break
+        if n == chunk_size:
+            yield chunk
+            chunk = _new_chunk(chunk_size)
+            n = 0
+    if n:
+        yield _trim_chunk(chunk, n)
+
+
+def _csv_chunks(csv_file, chunk_size):
+    for df in pd.read_csv(csv_file, chunksize=chunk_size, dtype=CSV_HEX_DTYPES, keep_default_na=False):
+        ids = df["arbitration_id"].str.strip()
+        timestamps = pd.to_numeric(df["timestamp"], errors="coerce")
+        # A row without an ID or timestamp is not a frame (as an unparsable log line);
+        # an empty data_field is a 0-byte payload
+        frames = (ids != "") & timestamps.notna()
+        if not frames.all():
+            df, ids, timestamps = df[frames], ids[frames], timestamps[frames]
+            if not len(df):
+                continue
+        payload, length = decode_payload(df["data_field"])
+        chunk = {
+            "timestamp": timestamps.to_numpy(dtype=np.float64),
+            "arbitration_id": np.array([int(x, 16) for x in ids], dtype=np.uint32),
+            "payload": payload,
+            "dlc": length,
+        }
+        if "attack" in df.columns:
+            chunk["label"] = df["attack"].to_numpy(dtype=np.uint8)
+        yield chunk
+
+
+def iter_can_chunks(path, chunk_size=DEFAULT_CHUNK_SIZE, fmt=None):
+    """Stream any supported CAN capture as typed columnar chunks.
+
+    The format is sniffed from the first lines unless `fmt` is given. Every
+    format yields the same columns as iter_candump_chunks; CSV captures also
+    carry their `attack` column as `label`.
+    """
+    fmt = fmt or sniff_format(path)
+    if fmt == "csv":
+        yield from _csv_chunks(path, chunk_size)
+        return
+    with open(path, 'rb') as file:
+        yield from _line_chunks(file, LINE_SPLITTERS[fmt], chunk_size)
+
+
+def iter_candump_chunks(log_file, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Stream a `(ts) can0 ID#DATA` log as fixed-size chunks of NumPy columns.
+
+    Each chunk is a dict with `timestamp` (float64), `arbitration_id` (uint32),
+    `payload` (n x 8 uint8, zero padded) and `dlc` (uint8). Only one chunk is
+    held in memory at a time, whatever the size of the log.
+    """
+    return iter_can_chunks(log_file, chunk_size, fmt="candump")
+
+
+def index_path_for(log_file):
+    return f"{log_file}{INDEX_SUFFIX}"
+
+
+def build_log_index(log_file, every=DEFAULT_INDEX_EVERY):
+    """Scan the log once and save the byte offset and timestamp of every `every`-th frame"""
+    split_line = LINE_SPLITTERS[raw_log_format(log_file)]
+    offsets = []
+    timestamps = []
+    frames = 0
+    with open(log_file, 'rb') as file:
+        position = 0
+        for line in file:
+            try:
+                frame = split_line(line)
+            except ValueError:
+                frame = None
+            if frame is not None:
+                if frames % every == 0:
+                    offsets.append(position)
+                    timestamps.append(frame[0])
+                frames += 1
+            position += len(line)
+
+    stat = os.stat(log_file)
+    index = {
+        "offsets": np.array(offsets, dtype=np.int64),
+        "timestamps": np.array(timestamps, dtype=np.float64),
+        "frames": frames,
+        "every": every,
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
+    with open(index_path_for(log_file), 'wb') as f:
+        np.savez(f, **index)
+    return index
+
+
+def load_log_index(log_file, every=DEFAULT_INDEX_EVERY):
+    """Load the sidecar index of `log_file`, rebuilding it when missing or stale"""
+    path = index_path_for(log_file)
+    if os.path.exists(path):
+        with np.load(path) as data:
+            index = {name: data[name] for name in data.files}
+        stat = os.stat(log_file)
+        if int(index["size"]) == stat.st_size and int(index["mtime_ns"]) == stat.st_mtime_ns:
+            return index
+    return build_log_index(log_file, every)
+
+
+def read_time_range(log_file, start, end, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield the frames with start <= timestamp <= end, seeking through the sidecar index.
+
+    The log is memory-mapped and parsing starts at the last indexed frame
+    strictly before `start`, so only about `every` frames outside the range
+    are read.
+    Works on both text log formats; timestamps are expected to be
+    non-decreasing, as loggers write them.
+    """
+    split_line = LINE_SPLITTERS[raw_log_format(log_file)]
+    index = load_log_index(log_file)
+    if not len(index["offsets"]):
+        return
+    # Last entry strictly before `start`: frames at `start` may begin in an earlier block
+    block = max(int(np.searchsorted(index["timestamps"], start, side="left")) - 1, 0)
+
+    with open(log_file, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        mm.seek(int(index["offsets"][block]))
+        lines = iter(mm.readline, b"")
+        for chunk in _line_chunks(lines, split_line, chunk_size, until=end):
+            timestamps = chunk["timestamp"]
+            mask = (timestamps >= start) & (timestamps <= end)
+            if mask.any():
+                yield {name: column[mask] for name, column in chunk.items()}
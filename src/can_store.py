@@ -0,0 +1,907 @@
+import contextlib
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import shutil
+import struct
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+try:
+    import zstandard
+except ImportError:  # optional, only needed for .csv.zst datasets
+    zstandard = None
+
+# Columnar datasets: a `<name>.cols` directory holding one .npy file per column
+COLUMNAR_SUFFIX = ".cols"
+META_FILE = "_columns.json"
+# Sharded datasets: a `<name>.shards` directory of immutable shards listed in a manifest
+SHARDED_SUFFIX = ".shards"
+MANIFEST_FILE = "manifest.json"
+# Sidecar index of every written dataset: rows, label and source counts and,
+# for CSV, the byte offset of every INDEX_BLOCK_ROWS-row block
+INDEX_SUFFIX = ".index.json"
+INDEX_FILE = "_index.json"
+INDEX_BLOCK_ROWS = 1 << 16
+INDEX_LABEL_COLUMNS = ("attack", "label", "Label", "prediction")
+# Rows per block when streaming a dataset
+DEFAULT_BLOCK_ROWS = 1 << 18
+# Compressed CSV datasets, by file suffix; every index block is its own gzip member / zstd frame
+COMPRESSED_SUFFIXES = {".gz": "gzip", ".zst": "zstd"}
+COMPRESSION_LEVELS = {"gzip": 1, "zstd": 3}
+# Bytes reserved for each .npy column header, so appends only rewrite the row count
+NPY_HEADER_SIZE = 128
+
+# Compact dtypes of the known dataset columns, applied by every loader.
+# Labels and flags use uint8 rather than bool so CSV output keeps its 0/1 text;
+# data_field is dictionary encoded (category) instead of one Python str per row.
+# Float features stay float64 so rewritten files keep their exact text.
+DATASET_DTYPES = {
+    "timestamp": "float64",
+    "arbitration_id": "uint16",
+    "inter_arrival_time": "float64",
+    "mean_delta_T": "float64",
+    "var_delta_T": "float64",
+    "entropy_ID": "float64",
+    "data_entropy": "float64",
+    "bit_flipping_rate": "float64",
+    "bit_flips": "uint8",
+    "dls": "uint8",
+    "flooding_attack": "uint8",
+    "replay_attack": "uint8",
+    "label": "uint8",
+    "attack": "uint8",
+    "data_field": "category",
+}
+
+
+# Hex text columns of raw captures (CSVs with a data_field column), always read as str:
+# per-chunk inference would turn a block of digit-only IDs or payloads ("0350",
+# "0000000000000000") into decimal numbers. Feature datasets drop data_field and
+# hold arbitration_id as a decimal integer, so they keep the inferred dtype.
+HEX_TEXT_COLUMNS = ("arbitration_id", "data_field")
+
+
+# In-memory only: float features the tree models read as float32 anyway
+FEATURE_FLOAT_COLUMNS = ("inter_arrival_time", "mean_delta_T", "var_delta_T", "entropy_ID",
+                         "data_entropy", "bit_flipping_rate")
+
+
+def _schema_dtype(series, dtype):
+    """`dtype` if `series` can be cast to it losslessly enough, else None"""
+    if dtype == "category":
+        return dtype if series.dtype.kind not in "biuf" else None
+    target = np.dtype(dtype)
+    if series.dtype == target or series.dtype.kind not in "biuf":
+        return None
+    if target.kind in "iu":
+        if series.dtype.kind == "f" and (series.isna().any() or (series % 1 != 0).any()):
+            return None
+        info = np.iinfo(target)
+        if len(series) and (series.min() < info.min or series.max() > info.max):
+            return None
+    return dtype
+
+
+def apply_schema(df):
+    """Cast the known columns of `df` to DATASET_DTYPES where the values fit"""
+    casts = {}
+    for name, dtype in DATASET_DTYPES.items():
+        if name in df.columns:
+            target = _schema_dtype(df[name], dtype)
+            if target is not None:
+                casts[name] = target
+    return df.astype(casts) if casts else df
+
+
+def downcast_features(df):
+    """float32 copies of the float feature columns, for training/detection; never write the result back"""
+    casts = {name: "float32" for name in FEATURE_FLOAT_COLUMNS
+             if name in df.columns and df[name].dtype == np.float64}
+    return df.astype(casts) if casts else df
+
+
+def _with_hex_text(path, kwargs):
+    """`kwargs` for read_csv with the HEX_TEXT_COLUMNS of a raw capture pinned to str"""
+    columns = pd.read_csv(path, nrows=0, **{k: v for k, v in kwargs.items() if k in ("sep", "delimiter")}).columns
+    if "data_field" not in columns:
+        return kwargs
+    dtypes = {name: str for name in HEX_TEXT_COLUMNS if name in columns}
+    return dict(kwargs, dtype={**dtypes, **(kwargs.get("dtype") or {})})
+
+
+def _read_csv_with_schema(path, **kwargs):
+    # Peek at the first rows so NaN-holding columns keep their default dtype,
+    # then let the C parser produce compact columns directly
+    kwargs = _with_hex_text(path, kwargs)
+    sample = pd.read_csv(path, nrows=1000, **{k: v for k, v in kwargs.items() if k != "nrows"})
+    dtypes = dict(kwargs.get("dtype") or {})
+    for name in sample.columns:
+        if name in DATASET_DTYPES:
+            target = _schema_dtype(sample[name], DATASET_DTYPES[name])
+            if target is not None or DATASET_DTYPES[name] == sample[name].dtype:
+                dtypes[name] = DATASET_DTYPES[name]
+    try:
+        df = pd.read_csv(path, **dict(kwargs, dtype=dtypes))
+    except (ValueError, OverflowError):
+        df = pd.read_csv(path, **kwargs)
+    return apply_schema(df)
+
+
+def is_columnar(path):
+    return str(path).rstrip("/\\").endswith(COLUMNAR_SUFFIX)
+
+
+def _npy_header(dtype, rows):
+    # Fixed-size .npy v1.0 header, so the row count can be rewritten in place after appends
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False, "shape": (rows,)})
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return np.lib.format.MAGIC_PREFIX + b"\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+def csv_compression(path):
+    """"gzip" / "zstd" for `.csv.gz` / `.csv.zst` paths, None for plain CSV"""
+    return COMPRESSED_SUFFIXES.get(os.path.splitext(str(path))[1])
+
+
+def _require_zstandard():
+    if zstandard is None:
+        raise ImportError("zstandard is required for .zst datasets: pip install zstandard")
+
+
+def _compressor(compression, level=None):
+    level = COMPRESSION_LEVELS[compression] if level is None else level
+    if compression == "gzip":
+        return lambda data: gzip.compress(data, compresslevel=level, mtime=0)
+    _require_zstandard()
+    return zstandard.ZstdCompressor(level=level).compress
+
+
+def _decompress(compression, data):
+    if compression == "gzip":
+        return gzip.decompress(data)
+    _require_zstandard()
+    # An appended block spans several frames
+    with zstandard.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True) as reader:
+        return reader.read()
+
+
+def _open_csv_bytes(path):
+    """Binary reader of the (decompressed) CSV text"""
+    compression = csv_compression(path)
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    if compression == "zstd":
+        _require_zstandard()
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True, closefd=True))
+    return open(path, "rb")
+
+
+class _CsvSink:
+    """Byte sink of a CSV dataset, optionally fed to a background writer thread.
+
+    Plain CSV text goes straight to the file. For compressed datasets the
+    text of each index block is buffered and written as one gzip member /
+    zstd frame, so a block can later be decompressed on its own. With
+    `background`, formatting in the caller overlaps with compression and I/O.
+    """
+
+    def __init__(self, path, mode, blocks, compression=None, level=None, background=False):
+        self._file = open(path, mode)
+        self._compress = _compressor(compression, level) if compression else None
+        self._pending = []
+        self.blocks = blocks
+        self._queue = None
+        self._error = None
+        if background:
+            # Bounded queue: a slow disk slows the producer instead of buffering the dataset
+            self._queue = queue.Queue(maxsize=8)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _apply(self, op, data):
+        if op == "write":
+            if self._compress is None:
+                self._file.write(data)
+            else:
+                self._pending.append(data)
+        elif op == "block":
+            self._flush_member()
+            if self.blocks is not None:
+                self.blocks.append(self._file.tell())
+        elif op == "flush":
+            self._flush_member()
+
+    def _flush_member(self):
+        if self._pending:
+            self._file.write(self._compress(b"".join(self._pending)))
+            self._pending = []
+
+    def _run(self):
+        while True:
+            op, data = self._queue.get()
+            if op == "close":
+                return
+            if self._error is None:
+                try:
+                    self._apply(op, data)
+                except BaseException as e:
+                    self._error = e
+
+    def submit(self, op, data=None):
+        if self._error is not None:
+            raise self._error
+        if self._queue is None:
+            self._apply(op, data)
+        else:
+            self._queue.put((op, data))
+
+    def close(self):
+        self.submit("flush")
+        if self._queue is not None:
+            self._queue.put(("close", None))
+            self._thread.join()
+        self._file.close()
+        if self._error is not None:
+            raise self._error
+
+
+def dataset_index_path(path):
+    if is_columnar(path):
+        return os.path.join(path, INDEX_FILE)
+    return f"{path}{INDEX_SUFFIX}"
+
+
+def _new_index(columns):
+    return {"rows": 0, "columns": list(columns), "labels": {}, "sources": {},
+            "block_rows": INDEX_BLOCK_ROWS, "blocks": []}
+
+
+def _label_key(value):
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        value = int(value)
+    return str(value)
+
+
+def _count_labels(index, df):
+    for name in INDEX_LABEL_COLUMNS:
+        if name in df.columns:
+            counts = index["labels"].setdefault(name, {})
+            for value, count in df[name].value_counts(dropna=False).items():
+                key = _label_key(value)
+                counts[key] = counts.get(key, 0) + int(count)
+
+
+def _save_index(path, index):
+    if not is_columnar(path):
+        # A CSV edited by another tool invalidates its index
+        stat = os.stat(path)
+        index["size"], index["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+    index_path = dataset_index_path(path)
+    with open(index_path + ".tmp", "w") as f:
+        json.dump(index, f)
+    os.replace(index_path + ".tmp", index_path)
+    return index
+
+
+def build_dataset_index(path):
+    """Scan an existing CSV or `.cols` dataset once and save its sidecar index"""
+    if is_columnar(path):
+        with open(os.path.join(path, META_FILE)) as f:
+            meta = json.load(f)
+        columns = [entry["name"] for entry in meta["columns"]]
+        index = _new_index(columns)
+        index["rows"] = meta["rows"]
+        _count_labels(index, read_columnar(path, columns=[c for c in columns if c in INDEX_LABEL_COLUMNS]))
+        return _save_index(path, index)
+
+    columns = list(pd.read_csv(path, nrows=0).columns) if os.path.getsize(path) else []
+    index = _new_index(columns)
+    if csv_compression(path):
+        # Member boundaries are not recoverable from the stream: no block offsets
+        index["blocks"] = None
+    with _open_csv_bytes(path) as f:
+        position = len(f.readline())
+        for line in f:
+            if index["blocks"] is not None and index["rows"] % INDEX_BLOCK_ROWS == 0:
+                index["blocks"].append(position)
+            position += len(line)
+            index["rows"] += 1
+    label_columns = [c for c in columns if c in INDEX_LABEL_COLUMNS]
+    if label_columns and index["rows"]:
+        for df in pd.read_csv(path, usecols=label_columns, chunksize=DEFAULT_BLOCK_ROWS):
+            _count_labels(index, df)
+    return _save_index(path, index)
+
+
+def load_dataset_index(path):
+    """Sidecar index of `path`, rebuilt by one scan when missing or stale.
+
+    `.shards` stores answer from their manifest.
+    """
+    if is_sharded(path):
+        store = ShardedStore(path)
+        index = _new_index([])
+        index["rows"] = store.rows
+        for shard in store.shards:
+            if shard.get("label_column"):
+                counts = index["labels"].setdefault(shard["label_column"], {})
+                for label, count in shard["labels"].items():
+                    counts[label] = counts.get(label, 0) + count
+            if "source" in shard:
+                index["sources"][shard["source"]] = index["sources"].get(shard["source"], 0) + shard["rows"]
+        return index
+    index_path = dataset_index_path(path)
+    if os.path.exists(index_path):
+        with open(index_path) as f:
+            index = json.load(f)
+        if is_columnar(path):
+            with open(os.path.join(path, META_FILE)) as f:
+                fresh = json.load(f)["rows"] == index["rows"]
+        else:
+            stat = os.stat(path)
+            fresh = index.get("size") == stat.st_size and index.get("mtime_ns") == stat.st_mtime_ns
+        if fresh:
+            return index
+    return build_dataset_index(path)
+
+
+def label_counts(path, label_column="attack"):
+    """value_counts() of `label_column` from the sidecar index, without reading the data"""
+    counts = load_dataset_index(path)["labels"].get(label_column)
+    if counts is None:
+        return None
+    keys = [int(k) if k.lstrip("-").isdigit() else k for k in counts]
+    return pd.Series(list(counts.values()), index=keys, name="count").sort_values(ascending=False)
+
+
+def read_row_block(path, block, index=None):
+    """Rows of CSV block `block` (INDEX_BLOCK_ROWS rows each), read by seeking to its byte offset"""
+    index = index or load_dataset_index(path)
+    if is_columnar(path):
+        start = block * index["block_rows"]
+        return read_columnar(path).iloc[start:start + index["block_rows"]]
+    nrows = min(index["block_rows"], index["rows"] - block * index["block_rows"])
+    if not index["blocks"]:
+        # No block offsets (compressed file indexed after the fact): stream up to the block
+        return pd.read_csv(path, skiprows=range(1, 1 + block * index["block_rows"]), nrows=nrows)
+    compression = csv_compression(path)
+    with open(path, "rb") as f:
+        f.seek(index["blocks"][block])
+        if compression is None:
+            return pd.read_csv(f, header=None, names=index["columns"], nrows=nrows)
+        # Each block is one gzip member / zstd frame: decompress only that one
+        end = index["blocks"][block + 1] if block + 1 < len(index["blocks"]) else os.path.getsize(path)
+        data = _decompress(compression, f.read(end - index["blocks"][block]))
+        return pd.read_csv(io.BytesIO(data), header=None, names=index["columns"], nrows=nrows)
+
+
+def sample_rows(path, n, seed=42):
+    """`n` rows drawn uniformly without replacement, parsing only the blocks that hold them"""
+    index = load_dataset_index(path)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(index["rows"], size=min(n, index["rows"]), replace=False))
+    blocks = rows // index["block_rows"]
+    frames = []
+    for block in np.unique(blocks):
+        df = read_row_block(path, int(block), index)
+        frames.append(df.iloc[rows[blocks == block] - block * index["block_rows"]])
+    if not frames:
+        return pd.DataFrame(columns=index["columns"])
+    return pd.concat(frames, ignore_index=True)
+
+
+class DatasetWriter:
+    """Append DataFrame blocks to a CSV or `.cols` dataset without holding their union.
+
+    The column order (and, for `.cols`, the column dtypes) is fixed by the
+    first block, or by the existing dataset when `append` is set. Every block
+    is written as soon as it arrives, so merging many files costs time linear
+    in their total size and memory of one block. On close the sidecar index
+    (rows, label counts, rows per `source`, CSV block offsets) is saved.
+
+    A `.csv.gz` / `.csv.zst` path is compressed block by block on a background
+    thread by default, so compression overlaps with computing the next block.
+    """
+
+    def __init__(self, path, append=False, schema=True, compression_level=None, background=None):
+        self.path = path
+        self.schema = schema
+        self.compression = csv_compression(path)
+        self.compression_level = compression_level
+        self.background = bool(self.compression) if background is None else background
+        self.rows = 0
+        self.columns = None
+        self._columnar = is_columnar(path)
+        self._files = {}
+        self._dtypes = {}
+        self._categories = {}
+        self._sink = None
+        self._index = None
+        if append and os.path.exists(path):
+            if self._columnar:
+                self._open_columnar()
+            elif os.path.getsize(path) > 0:
+                self._index = load_dataset_index(path)
+                self.columns = list(self._index["columns"])
+                self.rows = self._index["rows"]
+                self._sink = self._open_sink("ab")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _open_columnar(self):
+        with open(os.path.join(self.path, META_FILE)) as f:
+            meta = json.load(f)
+        self.rows = meta["rows"]
+        self.columns = [entry["name"] for entry in meta["columns"]]
+        self._index = load_dataset_index(self.path)
+        for entry in meta["columns"]:
+            name = entry["name"]
+            column_path = os.path.join(self.path, f"{name}.npy")
+            values = np.load(column_path, mmap_mode="r")
+            self._dtypes[name] = values.dtype
+            if entry["encoding"] == "dictionary":
+                categories = np.load(os.path.join(self.path, f"{name}.categories.npy")).astype(str)
+                self._categories[name] = {value: code for code, value in enumerate(categories)}
+            if values.offset == NPY_HEADER_SIZE:
+                self._files[name] = open(column_path, "r+b")
+                self._files[name].seek(0, os.SEEK_END)
+            else:
+                # Written by plain np.save: re-write once with the fixed-size header
+                values = np.array(values)
+                self._files[name] = open(column_path, "wb")
+                self._files[name].write(_npy_header(values.dtype, self.rows))
+                self._files[name].write(values.tobytes())
+
+    def _start_columnar(self, df):
+        os.makedirs(self.path, exist_ok=True)
+        for name in self.columns:
+            if df[name].dtype.kind in "biuf":
+                self._dtypes[name] = df[name].dtype
+            else:
+                # String columns are dictionary encoded: int32 codes + fixed-width bytes categories
+                self._dtypes[name] = np.dtype(np.int32)
+                self._categories[name] = {}
+            self._files[name] = open(os.path.join(self.path, f"{name}.npy"), "wb")
+            self._files[name].write(_npy_header(self._dtypes[name], 0))
+
+    def _encode(self, name, series):
+        if name not in self._categories:
+            if self._dtypes[name].kind in "iu" and series.isna().any():
+                raise ValueError(f"Column {name} has missing values, cannot append to {self._dtypes[name]}")
+            return series.to_numpy(dtype=self._dtypes[name])
+        mapping = self._categories[name]
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        lookup = np.array([mapping.setdefault(str(value), len(mapping)) for value in uniques], dtype=np.int32)
+        encoded = np.full(len(codes), -1, dtype=np.int32)
+        encoded[codes >= 0] = lookup[codes[codes >= 0]]
+        return encoded
+
+    def _open_sink(self, mode):
+        return _CsvSink(self.path, mode, self._index["blocks"], self.compression,
+                        self.compression_level, self.background)
+
+    def _write_csv(self, df):
+        if self._sink is None:
+            self._sink = self._open_sink("wb")
+            self._sink.submit("write", df.iloc[:0].to_csv(index=False).encode())
+        # Cut at INDEX_BLOCK_ROWS boundaries so every block start has a byte offset
+        start = 0
+        while start < len(df):
+            if self.rows % INDEX_BLOCK_ROWS == 0:
+                self._sink.submit("block")
+            size = min(len(df) - start, INDEX_BLOCK_ROWS - self.rows % INDEX_BLOCK_ROWS)
+            self._sink.submit("write", df.iloc[start:start + size].to_csv(index=False, header=False).encode())
+            start += size
+            self.rows += size
+
+    def write(self, df, source=None):
+        """Append `df`; `source` (e.g. the input file) is counted in the index"""
+        if self.columns is None:
+            self.columns = [str(name) for name in df.columns]
+            self._index = _new_index(self.columns)
+            if self._columnar:
+                self._start_columnar(apply_schema(df) if self.schema else df)
+        extra = set(map(str, df.columns)) - set(self.columns)
+        if extra:
+            raise ValueError(f"Columns {sorted(extra)} are not in {self.path}")
+        df = df.reindex(columns=self.columns)
+
+        _count_labels(self._index, df)
+        if source is not None:
+            self._index["sources"][str(source)] = self._index["sources"].get(str(source), 0) + len(df)
+        if self._columnar:
+            for name in self.columns:
+                self._files[name].write(np.ascontiguousarray(self._encode(name, df[name])).tobytes())
+            self.rows += len(df)
+        else:
+            self._write_csv(df)
+        return self.rows
+
+    def close(self):
+        if self._index is None:
+            self._index = _new_index(self.columns or [])
+        self._index["rows"] = self.rows
+        if not self._columnar:
+            if self._sink is not None:
+                self._sink.close()
+                self._sink = None
+            elif not os.path.exists(self.path):
+                self._open_sink("wb").close()
+            _save_index(self.path, self._index)
+            return self.path
+        os.makedirs(self.path, exist_ok=True)
+        columns = []
+        for name in self.columns or []:
+            f = self._files.pop(name)
+            f.seek(0)
+            f.write(_npy_header(self._dtypes[name], self.rows))
+            f.close()
+            entry = {"name": name, "encoding": "plain"}
+            if name in self._categories:
+                categories = np.array(list(self._categories[name]), dtype=str).astype(bytes)
+                np.save(os.path.join(self.path, f"{name}.categories.npy"), categories)
+                entry["encoding"] = "dictionary"
+            columns.append(entry)
+        with open(os.path.join(self.path, META_FILE), "w") as f:
+            json.dump({"rows": self.rows, "columns": columns}, f, indent=2)
+        _save_index(self.path, self._index)
+        return self.path
+
+
+def write_columnar(df, path):
+    """Write `df` as a directory of typed .npy columns that can be memory-mapped back"""
+    with DatasetWriter(path, schema=False) as writer:
+        writer.write(df)
+    return path
+
+
+def read_columnar(path, columns=None, mmap=True):
+    """Load a `.cols` directory; plain columns are memory-mapped, not parsed"""
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    mmap_mode = "r" if mmap else None
+
+    data = {}
+    for entry in meta["columns"]:
+        name = entry["name"]
+        if columns is not None and name not in columns:
+            continue
+        values = np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        if entry["encoding"] == "dictionary":
+            categories = np.load(os.path.join(path, f"{name}.categories.npy")).astype(str).astype(object)
+            codes = np.asarray(values)
+            if DATASET_DTYPES.get(name) == "category":
+                data[name] = pd.Categorical.from_codes(codes, categories)
+                continue
+            values = np.full(len(codes), np.nan, dtype=object)
+            if len(categories):
+                values[codes >= 0] = categories.take(codes[codes >= 0])
+        data[name] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def is_sharded(path):
+    return str(path).rstrip("/\\").endswith(SHARDED_SUFFIX)
+
+
+def _label_counts(df):
+    for name in ("label", "attack"):
+        if name in df.columns:
+            counts = df[name].value_counts(dropna=False)
+            return name, {str(key): int(value) for key, value in counts.items()}
+    return None, {}
+
+
+class ShardedStore:
+    """Append-only dataset made of immutable shards plus a `manifest.json`.
+
+    Each shard is one processed input (e.g. one file of one attack category of
+    one vehicle). Adding a shard writes only the new rows and a manifest entry
+    with their row and label counts, so growing the dataset costs O(new data)
+    and counts are answered from the manifest without reading any shard.
+    """
+
+    def __init__(self, path, shard_suffix=COLUMNAR_SUFFIX):
+        self.path = path
+        self.shard_suffix = shard_suffix
+        os.makedirs(path, exist_ok=True)
+        manifest_path = os.path.join(path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                self.shards = json.load(f)["shards"]
+        else:
+            self.shards = []
+
+    def _save_manifest(self):
+        manifest_path = os.path.join(self.path, MANIFEST_FILE)
+        with open(manifest_path + ".tmp", "w") as f:
+            json.dump({"shards": self.shards}, f, indent=2)
+        os.replace(manifest_path + ".tmp", manifest_path)
+
+    def find(self, **keys):
+        """Manifest entries whose fields match all of `keys`"""
+        return [shard for shard in self.shards if all(shard.get(k) == v for k, v in keys.items())]
+
+    def add(self, df, info=None, **keys):
+        """Write `df` as a new shard tagged with `keys` (vehicle, category, source, ...).
+
+        `info` holds extra manifest fields (e.g. a content hash) that are not
+        part of the shard file name.
+        """
+        entry = self._write_shard(df, info, keys)
+        self.shards.append(entry)
+        self._save_manifest()
+        return entry
+
+    def _write_shard(self, df, info, keys):
+        stem = "-".join(os.path.splitext(os.path.basename(str(value)))[0] for value in keys.values())
+        stem = "".join(c if c.isalnum() or c in "-_" else "_" for c in stem)
+        number = max((int(shard["file"].split("-", 1)[0]) for shard in self.shards), default=-1) + 1
+        name = f"{number:05d}-{stem}{self.shard_suffix}"
+        write_dataset(df, os.path.join(self.path, name))
+        label_column, labels = _label_counts(df)
+        return dict(keys, **(info or {}), file=name, rows=len(df), label_column=label_column, labels=labels)
+
+    def _delete_files(self, shards):
+        for shard in shards:
+            path = os.path.join(self.path, shard["file"])
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    def replace(self, df, info=None, **keys):
+        """Write `df` as the shard tagged with `keys`, in place of the matching shards.
+
+        The new entry takes the manifest position of the first match, so a
+        rebuilt input keeps its place in export order; with no match it is added.
+        """
+        old = self.find(**keys)
+        if not old:
+            return self.add(df, info, **keys)
+        entry = self._write_shard(df, info, keys)
+        position = self.shards.index(old[0])
+        self.shards = [shard for shard in self.shards if shard not in old]
+        self.shards.insert(position, entry)
+        self._save_manifest()
+        self._delete_files(old)
+        return entry
+
+    def remove(self, **keys):
+        """Drop the matching shards from the manifest and delete their files"""
+        removed = self.find(**keys)
+        self.shards = [shard for shard in self.shards if shard not in removed]
+        self._save_manifest()
+        self._delete_files(removed)
+        return removed
+
+    @property
+    def rows(self):
+        return sum(shard["rows"] for shard in self.shards)
+
+    def label_counts(self, **keys):
+        counts = {}
+        for shard in self.find(**keys):
+            for label, count in shard["labels"].items():
+                counts[label] = counts.get(label, 0) + count
+        return counts
+
+    def iter_frames(self, columns=None, **keys):
+        """Lazily yield one DataFrame per matching shard, in manifest order"""
+        for shard in self.find(**keys):
+            path = os.path.join(self.path, shard["file"])
+            yield read_dataset(path, usecols=columns) if columns else read_dataset(path)
+
+    def read(self, columns=None, **keys):
+        frames = list(self.iter_frames(columns, **keys))
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+    def export(self, path, **keys):
+        """Stream the matching shards into one CSV or `.cols` dataset"""
+        with DatasetWriter(path) as writer:
+            for df in self.iter_frames(**keys):
+                writer.write(df)
+        return writer.rows
+
+
+def file_digest(path, block_size=1 << 20):
+    """sha256 of the file content"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """Processed-feature cache keyed by input content hash and feature spec.
+
+    `spec` names everything besides the input bytes that changes the output
+    (pipeline name, FEATURE_SPEC_VERSION, parameters); bump it when the
+    feature code changes. Content hashes are memoized by (size, mtime) so an
+    unchanged input is not even re-read. Parallel builders should `prime` the
+    memo with every input in the parent before dispatching work, so workers
+    only read it.
+    """
+
+    MEMO_FILE = "stat_memo.json"
+    # A memo lock older than this is left over from a crashed builder
+    LOCK_TIMEOUT = 30.0
+
+    def __init__(self, cache_dir, spec):
+        self.cache_dir = cache_dir
+        self.spec = str(spec)
+        os.makedirs(cache_dir, exist_ok=True)
+        self._memo_path = os.path.join(cache_dir, self.MEMO_FILE)
+        self._memo = self._load_memo()
+        self.hits = 0
+        self.misses = 0
+
+    def _load_memo(self):
+        if not os.path.exists(self._memo_path):
+            return {}
+        try:
+            with open(self._memo_path) as f:
+                return json.load(f)
+        except ValueError:
+            return {}
+
+    @contextlib.contextmanager
+    def _memo_lock(self):
+        # Lock file created with O_EXCL: works on every platform and filesystem the cache lives on
+        lock = f"{self._memo_path}.lock"
+        while True:
+            try:
+                fd = os.open(lock, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.stat(lock).st_mtime > self.LOCK_TIMEOUT:
+                        os.remove(lock)
+                except FileNotFoundError:
+                    pass
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            os.remove(lock)
+
+    def _save_memo(self):
+        # Read-merge-write under the lock, so concurrent builders never drop each other's entries
+        with self._memo_lock():
+            memo = self._load_memo()
+            memo.update(self._memo)
+            self._memo = memo
+            # Per-process temporary name: several builders may share one cache directory
+            tmp = f"{self._memo_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(memo, f)
+            os.replace(tmp, self._memo_path)
+
+    def _digest(self, path):
+        """(digest, True if it had to be computed)"""
+        stat = os.stat(path)
+        entry = self._memo.get(os.path.abspath(path))
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2], False
+        digest = file_digest(path)
+        self._memo[os.path.abspath(path)] = [stat.st_size, stat.st_mtime_ns, digest]
+        return digest, True
+
+    def digest(self, path):
+        digest, computed = self._digest(path)
+        if computed:
+            self._save_memo()
+        return digest
+
+    def prime(self, paths):
+        """Hash every input not yet memoized and save the memo once"""
+        if any([self._digest(path)[1] for path in paths]):
+            self._save_memo()
+
+    def entry_path(self, path):
+        key = hashlib.sha256(f"{self.spec}\0{self.digest(path)}".encode()).hexdigest()
+        return os.path.join(self.cache_dir, key[:32] + COLUMNAR_SUFFIX)
+
+    def get_or_build(self, path, build):
+        """Cached features of `path`, or `build(path)` stored for the next run"""
+        entry = self.entry_path(path)
+        if os.path.exists(os.path.join(entry, META_FILE)):
+            self.hits += 1
+            return read_columnar(entry)
+        self.misses += 1
+        df = build(path)
+        # Write under a temporary name so an interrupted build never leaves a partial entry.
+        # No schema cast: a cache hit must give back exactly what `build` returned
+        tmp = f"{entry[:-len(COLUMNAR_SUFFIX)]}.{os.getpid()}.tmp{COLUMNAR_SUFFIX}"
+        write_columnar(df, tmp)
+        try:
+            os.replace(tmp, entry)
+        except OSError:
+            # Another process stored the same content first
+            shutil.rmtree(tmp, ignore_errors=True)
+        return df
+
+
+def read_dataset(path, schema=True, **kwargs):
+    """Read a dataset from CSV, the columnar `.cols` layout or a `.shards` store, by path suffix.
+
+    With `schema` the known columns come back with the compact DATASET_DTYPES.
+    """
+    if is_sharded(path):
+        if not os.path.isdir(path):
+            raise FileNotFoundError(path)
+        return ShardedStore(path).read(columns=kwargs.get("usecols"))
+    if is_columnar(path):
+        return read_columnar(path, columns=kwargs.get("usecols"))
+    if schema:
+        return _read_csv_with_schema(path, **kwargs)
+    return pd.read_csv(path, **kwargs)
+
+
+def iter_dataset(path, chunksize=DEFAULT_BLOCK_ROWS, schema=True, **kwargs):
+    """Stream a CSV, `.cols` or `.shards` dataset as DataFrame blocks of at most `chunksize` rows"""
+    if is_sharded(path):
+        store = ShardedStore(path)
+        for shard in store.shards:
+            yield from iter_dataset(os.path.join(store.path, shard["file"]), chunksize, schema, **kwargs)
+        return
+    if is_columnar(path):
+        # Memory-mapped columns: slicing only pages in the block being read
+        df = read_columnar(path, columns=kwargs.get("usecols"))
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+        return
+    for df in pd.read_csv(path, chunksize=chunksize, **_with_hex_text(path, kwargs)):
+        yield apply_schema(df) if schema else df
+
+
+def remove_dataset(path):
+    """Delete a CSV or `.cols`/`.shards` dataset together with its sidecar index"""
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    if not is_columnar(path) and os.path.exists(dataset_index_path(path)):
+        os.remove(dataset_index_path(path))
+
+
+def move_dataset(src, dst):
+    """Replace `dst` by `src`, keeping the sidecar index valid"""
+    if os.path.isdir(dst):
+        shutil.rmtree(dst)
+    os.replace(src, dst)
+    if not is_columnar(src) and os.path.exists(dataset_index_path(src)):
+        os.replace(dataset_index_path(src), dataset_index_path(dst))
+    return dst
+
+
+def write_dataset(df, path, compression_level=None):
+    """Write a dataset as CSV (`.csv.gz`/`.csv.zst` compressed) or as the columnar `.cols`
+    layout, by path suffix, with its sidecar index"""
+    if is_columnar(path):
+        # Store the compact dtypes so a later load is a plain memory map
+        return write_columnar(apply_schema(df), path)
+    with DatasetWriter(path, compression_level=compression_level) as writer:
+        writer.write(df)
+    return path
+
+
+def is_csv(path):
+    return str(path).endswith((".csv", ".csv.gz", ".csv.zst"))
+
+
+def list_datasets(input_dir):
+    """CSV files (plain or compressed), `.cols` and `.shards` directories directly under `input_dir`"""
+    return [f for f in os.listdir(input_dir) if is_csv(f) or is_columnar(f) or is_sharded(f)]
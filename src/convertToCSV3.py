@@ -1,165 +1,165 @@
-import pandas as pd
 import numpy as np
-from collections import Counter
 import glob
+from concurrent.futures import ProcessPoolExecutor
+from can_store import read_dataset, DatasetWriter, ShardedStore, BuildCache, file_digest
+from can_features import PayloadFeatureCache, InterArrivalTracker
 
 path1 = "su2017"
 path2 = "2011-chevrolet-impala"
 path3 = "2011-chevrolet-traverse"
 path4 = "2016-chevrolet-silverado"
 
-def calculate_entropy(hex_data):
-    if(type(hex_data) == float):
-        return 0
-    if not hex_data or len(hex_data) % 2 != 0:
-        return 0 
-    
-    byte_values = [hex_data[i:i+2] for i in range(0, len(hex_data), 2)]
-    
-    byte_counts = Counter(byte_values)
-    total_bytes = len(byte_values)
-    
-    probabilities = [count / total_bytes for count in byte_counts.values()]
-    entropy = -sum(p * np.log2(p) for p in probabilities if p > 0)
-    
-    return entropy
+FEATURE_SPEC_VERSION = 1
+BUILD_CACHE_DIR = "src/datasets_release/.build_cache"
+
+_feature_cache = PayloadFeatureCache()
 
 def compute_entropy_for_dataframe(df):
-    df["data_entropy"] = df["data_field"].apply(calculate_entropy).round(3)
+    features = _feature_cache.features(df["data_field"])
+    df["data_entropy"] = np.round(features["data_entropy"], 3)
+    df["dls"] = features["dls"]
     return df
 
 def preprocess_dataframe(df):
     df["arbitration_id"] = df["arbitration_id"].apply(lambda x: int(x, 16))  
     df["timestamp"] = df["timestamp"].astype(float)  
-    df["inter_arrival_time"] = df.groupby("arbitration_id")["timestamp"].diff().fillna(0).round(4)
+    df["inter_arrival_time"] = InterArrivalTracker(decimals=4).update_many(df["arbitration_id"], df["timestamp"])
+    return df
+
+
+def expand_input_files(input_files):
+    """Một pattern glob (vd: "src/su2017/DoS-attacks/*.csv") hoặc list đường dẫn -> list file"""
+    if isinstance(input_files, str):
+        return sorted(glob.glob(input_files))
+    return list(input_files)
+
+def build_features(file):
+    """Đặc trưng của một file capture (chưa gán label)"""
+    df = read_dataset(file)
+    print(f"File {file} có {len(df)} mẫu")
+    df = preprocess_dataframe(df)
+    df = compute_entropy_for_dataframe(df)
+    df = df.drop(columns=["timestamp"])
+    df.drop(columns=['data_field'], inplace=True)
     return df
 
+def open_build_cache(cache_dir=BUILD_CACHE_DIR):
+    return BuildCache(cache_dir, f"convertToCSV3-{FEATURE_SPEC_VERSION}")
 
-def process_and_merge_csv(input_files, output_file, label=0):
-    merged_df = pd.DataFrame()
+def load_features(file, cache=None):
+    # File không đổi nội dung thì lấy lại đặc trưng đã tính từ build cache
+    if cache is None:
+        return build_features(file)
+    return cache.get_or_build(file, build_features)
+
+def _append_files(writer, input_files, label, cache=None):
+    # Xử lý từng file rồi ghi nối tiếp vào writer, không giữ toàn bộ dữ liệu đã gộp
     samples_count = 0
-    for file in input_files:
-        df = pd.read_csv(file)
-        print(f"File {file} có {len(df)} mẫu")
+    for file in expand_input_files(input_files):
+        df = load_features(file, cache)
         samples_count += len(df)
-        df = preprocess_dataframe(df)
-        df = compute_entropy_for_dataframe(df)
-        df['dls'] = df['data_field'].apply(lambda x: len(str(x).replace(" ", "")) // 2)
-        df = df.drop(columns=["timestamp"])
-        df.drop(columns=['data_field'], inplace=True)
         df['label'] = label
-        merged_df = pd.concat([merged_df, df], ignore_index=True)
+        writer.write(df, source=file)
+    return samples_count
+
+def process_and_merge_csv(input_files, output_file, label=0, cache=None, compression_level=None):
+    with DatasetWriter(output_file, compression_level=compression_level) as writer:
+        samples_count = _append_files(writer, input_files, label, cache)
 
-    merged_df.to_csv(output_file, index=False)
     if(samples_count == 0):
         print("Không có dữ liệu nào được gộp")
     else:
         print(f"Tất cả dữ liệu đã được gộp vào: {output_file}, bao gồm: {samples_count} mẫu")    
 
-def process_and_merge_csv_with_mode(input_files, output_file, mode="single", label=0):
+def process_and_merge_csv_with_mode(input_files, output_file, mode="single", label=0, cache=None):
     print(f"Xử lý files: {input_files}")
-    merged_df = pd.DataFrame()
-    samples_count = 0
-    if(mode == "single"):
-        merged_df = pd.read_csv(output_file)  
-        samples_count = len(merged_df)
-        print(f"Dữ liệu đã được gộp từ trước: {samples_count} mẫu")  
-    for file in input_files:
-        df = pd.read_csv(file)
-        print(f"File {file} có {len(df)} mẫu")
-        samples_count += len(df)
-        df = preprocess_dataframe(df)
-        df = compute_entropy_for_dataframe(df)
-        df['dls'] = df['data_field'].apply(lambda x: len(str(x).replace(" ", "")) // 2)
-        df = df.drop(columns=["timestamp"])
-        df.drop(columns=['data_field'], inplace=True)
-        df['label'] = label
-        merged_df = pd.concat([merged_df, df], ignore_index=True)
+    # mode "single": ghi nối tiếp vào output đã có thay vì đọc lại toàn bộ file
+    with DatasetWriter(output_file, append=(mode == "single")) as writer:
+        if(mode == "single"):
+            print(f"Dữ liệu đã được gộp từ trước: {writer.rows} mẫu")
+        _append_files(writer, input_files, label, cache)
+        samples_count = writer.rows
 
-    merged_df.to_csv(output_file, index=False)
     if(samples_count == 0):
         print("Không có dữ liệu nào được gộp")
     else:
         print(f"Tất cả dữ liệu đã được gộp vào: {output_file}, bao gồm: {samples_count} mẫu")    
 
-crtPath = path1
-
-fs = {
-    "free_atk_path": f"src/{crtPath}/attack-free/*.csv",
-    "dos_atk_path": f"src/{crtPath}/DoS-attacks/*.csv",
-    "fuzzy_atk_path": f"src/{crtPath}/fuzzing-attacks/*.csv",
-    "gear_atk_path": f"src/{crtPath}/gear-attacks/*.csv",
-    "speed_atk_path": f"src/{crtPath}/speed-attacks/*.csv",
-    "interval_atk_path": f"src/{crtPath}/interval-attacks/*.csv",
-    "combined_atk_path": f"src/{crtPath}/combined-attacks/*.csv",
-    "rpm_atk_path": f"src/{crtPath}/rpm-attacks/*.csv",
-    "standstill_atk_path": f"src/{crtPath}/standstill-attacks/*.csv",
-    "synsematic_atk_path": f"src/{crtPath}/systematic-attacks/*.csv",
-    "output": "src/datasets_release/can_data_v7_3.csv"
+# Thư mục attack-type -> label
+CATEGORIES = {
+    "attack-free": 0,
+    "DoS-attacks": 1,
+    "fuzzing-attacks": 1,
+    "gear-attacks": 1,
+    "speed-attacks": 1,
+    "interval-attacks": 1,
+    "combined-attacks": 1,
+    "rpm-attacks": 1,
+    "standstill-attacks": 1,
+    "systematic-attacks": 1,
 }
 
-input_files_atk_free = fs["free_atk_path"]  
-input_files_dos = fs["dos_atk_path"]  
-input_files_fuz = fs["fuzzy_atk_path"]  
-input_files_gear = fs["gear_atk_path"]
-input_files_speed = fs["speed_atk_path"] 
-input_files_interval = fs["interval_atk_path"]
-input_files_combined = fs["combined_atk_path"]
-input_files_rpm = fs["rpm_atk_path"]
-input_files_standstill = fs["standstill_atk_path"]
-input_files_synsematic = fs["synsematic_atk_path"]  
-output_file = fs["output"]
-
-
-
-process_and_merge_csv(input_files_atk_free, output_file, 0)
-process_and_merge_csv_with_mode(input_files_dos, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_fuz, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_gear, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_speed, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_interval, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_combined, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_rpm, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_standstill, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_synsematic, output_file, mode='single', label=1)
-
-crtPath = path2
-
-fs = {
-    "free_atk_path": f"src/{crtPath}/attack-free/*.csv",
-    "dos_atk_path": f"src/{crtPath}/DoS-attacks/*.csv",
-    "fuzzy_atk_path": f"src/{crtPath}/fuzzing-attacks/*.csv",
-    "gear_atk_path": f"src/{crtPath}/gear-attacks/*.csv",
-    "speed_atk_path": f"src/{crtPath}/speed-attacks/*.csv",
-    "interval_atk_path": f"src/{crtPath}/interval-attacks/*.csv",
-    "combined_atk_path": f"src/{crtPath}/combined-attacks/*.csv",
-    "rpm_atk_path": f"src/{crtPath}/rpm-attacks/*.csv",
-    "standstill_atk_path": f"src/{crtPath}/standstill-attacks/*.csv",
-    "synsematic_atk_path": f"src/{crtPath}/systematic-attacks/*.csv",
-    "output": "src/datasets_release/can_data_v7_3.csv"
-}
+def build_unit(vehicle, category, label, known, cache_dir=BUILD_CACHE_DIR):
+    """Đặc trưng của các file mới/đã đổi trong (vehicle, category).
+
+    `known` là {source: sha256} đã có trong manifest. Không ghi vào store nên
+    chạy được song song trong process pool; trả về list (file, sha256, dataframe).
+    """
+    cache = open_build_cache(cache_dir) if cache_dir else None
+    built = []
+    for file in expand_input_files(f"src/{vehicle}/{category}/*.csv"):
+        digest = cache.digest(file) if cache is not None else file_digest(file)
+        if file in known and known[file] == digest:
+            continue
+        df = load_features(file, cache)
+        df['label'] = label
+        built.append((file, digest, df))
+    return built
 
-input_files_atk_free = fs["free_atk_path"]  
-input_files_dos = fs["dos_atk_path"]  
-input_files_fuz = fs["fuzzy_atk_path"]  
-input_files_gear = fs["gear_atk_path"]
-input_files_speed = fs["speed_atk_path"] 
-input_files_interval = fs["interval_atk_path"]
-input_files_combined = fs["combined_atk_path"]
-input_files_rpm = fs["rpm_atk_path"]
-input_files_standstill = fs["standstill_atk_path"]
-input_files_synsematic = fs["synsematic_atk_path"]  
-output_file = fs["output"]
-
-
-
-process_and_merge_csv(input_files_atk_free, output_file, 0)
-process_and_merge_csv_with_mode(input_files_dos, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_fuz, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_gear, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_speed, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_interval, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_combined, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_rpm, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_standstill, output_file, mode='single', label=1)
-process_and_merge_csv_with_mode(input_files_synsematic, output_file, mode='single', label=1)
+def add_unit_to_store(store, vehicle, category, built):
+    """Thay shard của các file trong `built` tại chỗ (file mới thì thêm vào cuối), theo đúng thứ tự file"""
+    samples_count = 0
+    for file, digest, df in built:
+        store.replace(df, info={"sha256": digest}, vehicle=vehicle, category=category, source=file)
+        samples_count += len(df)
+    return samples_count
+
+def add_category_to_store(store, vehicle, category, label, cache_dir=BUILD_CACHE_DIR):
+    """Mỗi file của (vehicle, category) thành một shard bất biến.
+
+    File đã có trong manifest với cùng nội dung thì bỏ qua; file bị thay đổi
+    thì shard cũ được thay bằng shard mới.
+    """
+    known = {shard["source"]: shard.get("sha256") for shard in store.find(vehicle=vehicle, category=category)}
+    return add_unit_to_store(store, vehicle, category, build_unit(vehicle, category, label, known, cache_dir))
+
+def build_store(store, vehicles, parallel=True, workers=None, cache_dir=BUILD_CACHE_DIR):
+    """Build mọi (vehicle, category) song song trong process pool.
+
+    Các đơn vị độc lập nhau; kết quả được ghi vào store theo thứ tự cố định
+    (vehicle rồi category) nên manifest giống hệt khi chạy tuần tự.
+    """
+    units = [(vehicle, category, label) for vehicle in vehicles for category, label in CATEGORIES.items()]
+    knowns = [{shard["source"]: shard.get("sha256") for shard in store.find(vehicle=v, category=c)} for v, c, _ in units]
+    if not parallel:
+        results = (build_unit(v, c, label, known, cache_dir) for (v, c, label), known in zip(units, knowns))
+        for (vehicle, category, _), built in zip(units, results):
+            samples_count = add_unit_to_store(store, vehicle, category, built)
+            print(f"{vehicle}/{category}: thêm {samples_count} mẫu, tổng: {store.rows} mẫu")
+        return store
+    if cache_dir:
+        open_build_cache(cache_dir).prime([file for v, c, _ in units for file in expand_input_files(f"src/{v}/{c}/*.csv")])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(build_unit, v, c, label, known, cache_dir) for (v, c, label), known in zip(units, knowns)]
+        for (vehicle, category, _), future in zip(units, futures):
+            samples_count = add_unit_to_store(store, vehicle, category, future.result())
+            print(f"{vehicle}/{category}: thêm {samples_count} mẫu, tổng: {store.rows} mẫu")
+    return store
+
+if __name__ == "__main__":
+    store = ShardedStore("src/datasets_release/can_data_v7_3.shards")
+    build_store(store, [path1, path2, path3, path4])
+
+    output_file = "src/datasets_release/can_data_v7_3.csv"
+    store.export(output_file)
+    print(f"Tất cả dữ liệu đã được gộp vào: {output_file}, bao gồm: {store.rows} mẫu, label: {store.label_counts()}")
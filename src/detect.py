@@ -1,6 +1,8 @@
 import pandas as pd
 import joblib
 import os
+from can_store import read_dataset, DatasetWriter, downcast_features
+from can_features import decode_payload, payload_to_int
 
 def convert_timestamp(ts):
     try:
@@ -12,10 +14,12 @@ def convert_timestamp(ts):
 def preprocess_data(df):
     df = df.copy()
     df['timestamp'] = df['timestamp'].apply(convert_timestamp)
-    for col in ['arbitration_id', 'data_field']:
-        if df[col].dtype == object:
-            df[col] = df[col].apply(lambda x: int(x, 16) if isinstance(x, str) else x)
-    return df
+    if not pd.api.types.is_numeric_dtype(df['arbitration_id']):
+        df['arbitration_id'] = df['arbitration_id'].apply(lambda x: int(x, 16) if isinstance(x, str) else x)
+    if not pd.api.types.is_numeric_dtype(df['data_field']):
+        df['data_field'] = payload_to_int(*decode_payload(df['data_field']))
+    # Chỉ bản dùng để dự đoán bị downcast, df ghi ra file giữ nguyên float64
+    return downcast_features(df)
 
 # Đường dẫn file
 test_file_path = 'src/datasets/train_01/set_04/test_01_known_vehicle_known_attack/speed-accessory-1.csv'                
@@ -24,7 +28,7 @@ test_file_path3 = 'src/datasets/train_01/set_04/test_03_known_vehicle_unknown_at
 test_file_path4 = 'src/datasets/train_01/set_01/test_01_known_vehicle_known_attack/DoS-4.csv'                
 model_file_path = 'src/model_release/model_candata_train_balance_set.pkl'     
 
-def detect_set_of_test(CSVlist, outputDir, output_file_name = "test_result_with_prediction.csv"):
+def detect_set_of_test(CSVlist, outputDir, output_file_name = "test_result_with_prediction.csv", compression_level=None):
     file_name = output_file_name.split(".")[0]
     isExist = not os.path.exists(outputDir) and not os.path.isdir(outputDir)
     if isExist:
@@ -34,32 +38,37 @@ def detect_set_of_test(CSVlist, outputDir, output_file_name = "test_result_with_
         print(f"📁 Folder already exists: {outputDir}")
     path = os.path.join(outputDir, output_file_name)
 
-    df_test = pd.DataFrame()
-    for csv_file in CSVlist:
-        df_temp = pd.read_csv(csv_file)
-        df_test = pd.concat([df_test, df_temp], ignore_index=True)
+    model = joblib.load(model_file_path)
 
-    df_test_processed = preprocess_data(df_test)
+    # Dự đoán từng file rồi ghi ngay; việc nén/ghi chạy song song với dự đoán file tiếp theo
+    total = 0
+    equal_counts = pd.Series(dtype="int64")
+    with DatasetWriter(path, compression_level=compression_level) as writer:
+        for csv_file in CSVlist:
+            df_test = read_dataset(csv_file)
+            df_test_processed = preprocess_data(df_test)
 
-    model = joblib.load(model_file_path)
+            X_test = df_test_processed[['timestamp', 'arbitration_id', 'data_field']]
 
-    X_test = df_test_processed[['timestamp', 'arbitration_id', 'data_field']]
+            df_test['prediction'] = model.predict(X_test)
+            df_test['is_equal'] = df_test['attack'] == df_test['prediction']
+            equal_counts = equal_counts.add(df_test['is_equal'].value_counts(), fill_value=0)
+            total += len(df_test)
+            writer.write(df_test, source=csv_file)
 
-    df_test['prediction'] = model.predict(X_test)
-    df_test['is_equal'] = df_test['attack'] == df_test['prediction']
-    if df_test['is_equal'].all():
+    ratio = (equal_counts / total).sort_values(ascending=False).rename("proportion")
+    ratio.index.name = "is_equal"
+    if equal_counts.get(False, 0) == 0:
         print("✅ Tất cả dự đoán đều chính xác.")
     else:
         print("❌ Có một số dự đoán không chính xác.")
-        ratio = df_test["is_equal"].value_counts(normalize=True)
         print(ratio)
     with open(os.path.join(outputDir, f"{file_name}_logger.txt"), 'w') as f:
         for csv_file in CSVlist:
             f.write(f"files: {csv_file} \n")
-        f.write(f"total: {len(df_test)} \n")
+        f.write(f"total: {total} \n")
         f.write(ratio.to_string())
         f.write("\n")
-    df_test.to_csv(path, index=False)
     print(f"✅ Dự đoán hoàn tất. File kết quả: {path}")
 
 if __name__ == "__main__":
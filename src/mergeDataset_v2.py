@@ -1,72 +1,60 @@
 import os
 import pandas as pd
-from collections import Counter
 import numpy as np
+from can_store import read_dataset, write_dataset, list_datasets, DatasetWriter, move_dataset, remove_dataset
+from can_features import PayloadFeatureCache, InterArrivalTracker
+from can_dedup import external_dedup
 
-def calculate_entropy(hex_data):
-    if(type(hex_data) == float):
-        return 0
-    if not hex_data or len(hex_data) % 2 != 0:
-        return 0
-
-    byte_values = [hex_data[i:i+2] for i in range(0, len(hex_data), 2)]
-
-    byte_counts = Counter(byte_values)
-    total_bytes = len(byte_values)
-
-    probabilities = [count / total_bytes for count in byte_counts.values()]
-    entropy = -sum(p * np.log2(p) for p in probabilities if p > 0)
-
-    return entropy
+_feature_cache = PayloadFeatureCache()
 
 def compute_entropy_for_dataframe(df):
-    df["data_entropy"] = df["data_field"].apply(calculate_entropy).round(5)
+    features = _feature_cache.features(df["data_field"])
+    df["data_entropy"] = np.round(features["data_entropy"], 5)
+    df["dls"] = features["dls"]
     return df
 
 def preprocess_dataframe(df):
     df["arbitration_id"] = df["arbitration_id"].apply(lambda x: int(x, 16))
     df["timestamp"] = df["timestamp"].astype(float)
-    df["inter_arrival_time"] = df.groupby("arbitration_id")["timestamp"].diff().fillna(0).round(6)
+    df["inter_arrival_time"] = InterArrivalTracker(decimals=6).update_many(df["arbitration_id"], df["timestamp"])
     return df
 
 
-def merge_csv_files(input_files, output_file, output_file_name = "dataset_updated_v1.csv", mode="push", label=0):
-    df_list = pd.DataFrame()
-
-    if mode == "push":
-        df_list = pd.read_csv(os.path.join(output_file, "dataset_updated_v1.csv"))
-        samples_count = len(df_list)
-        print(f"Data already merged: {samples_count} samples")
-
+def merge_csv_files(input_files, output_file, output_file_name = "dataset_updated_v1.csv", mode="push", label=0, compression_level=None):
     _, output_dir = check_dir(output_file)
 
     try:
-        files = [f for f in os.listdir(input_files) if f.endswith(".csv")]
+        files = list_datasets(input_files)
     except FileNotFoundError:
         print(f"File: {input_files} not found.")
         return None
-    try:
-        for file in files:
-            print(f"Reading file: {file}")
-            df = pd.read_csv(os.path.join(input_files, file))
-            df = preprocess_dataframe(df)
-            df = compute_entropy_for_dataframe(df)
-            df['dls'] = df['data_field'].apply(lambda x: len(str(x).replace(" ", "")) // 2)
-            df = df.drop(columns=["timestamp"])
-            df.drop(columns=['data_field'], inplace=True)
-            df["label"] = label
-            df_list = pd.concat([df_list, df], ignore_index=True)
-    except Exception as e:
-        print(f"Error reading files in {input_files}: {e}")
 
+    # Mỗi file được xử lý rồi ghi nối tiếp vào output, không giữ toàn bộ dữ liệu trong RAM
     out_path = os.path.join(output_dir, output_file_name)
-    df_list.to_csv(out_path, index=False)
-    print(f"All data merged into: {out_path}, including: {len(df_list)} samples")
+    pushed_path = os.path.join(output_file, "dataset_updated_v1.csv")
+    append = mode == "push" and os.path.abspath(pushed_path) == os.path.abspath(out_path)
+    with DatasetWriter(out_path, append=append, compression_level=compression_level) as writer:
+        if mode == "push":
+            if not append:
+                writer.write(read_dataset(pushed_path))
+            print(f"Data already merged: {writer.rows} samples")
+        try:
+            for file in files:
+                print(f"Reading file: {file}")
+                df = read_dataset(os.path.join(input_files, file))
+                df = preprocess_dataframe(df)
+                df = compute_entropy_for_dataframe(df)
+                df = df.drop(columns=["timestamp"])
+                df.drop(columns=['data_field'], inplace=True)
+                df["label"] = label
+                writer.write(df, source=file)
+        except Exception as e:
+            print(f"Error reading files in {input_files}: {e}")
+
+    print(f"All data merged into: {out_path}, including: {writer.rows} samples")
     return out_path
 
 def merge_csv_only(input_files, output_file, output_file_name = "dataset_updated_v1.csv"):
-    df_list = pd.DataFrame()
-
     _, output_dir = check_dir(output_file)
 
     try:
@@ -74,22 +62,24 @@ def merge_csv_only(input_files, output_file, output_file_name = "dataset_updated
     except FileNotFoundError:
         print(f"File: {input_files} not found.")
         return None
-    try:
-        for file in files:
-            print(f"Reading file: {file}")
-            df = pd.read_csv(os.path.join(input_files, file))
-            df_list = pd.concat([df_list, df], ignore_index=True)
-    except Exception as e:
-        print(f"Error reading files in {input_files}: {e}")
 
     out_path = os.path.join(output_dir, output_file_name)
-    df_list.to_csv(out_path, index=False)
-    print(f"All data merged into: {out_path}, including: {len(df_list)} samples")
+    with DatasetWriter(out_path) as writer:
+        try:
+            for file in files:
+                print(f"Reading file: {file}")
+                writer.write(read_dataset(os.path.join(input_files, file)), source=file)
+        except Exception as e:
+            print(f"Error reading files in {input_files}: {e}")
+
+    print(f"All data merged into: {out_path}, including: {writer.rows} samples")
     return out_path
 
-def check_duplicate(inputCSV):
+def check_duplicate(inputCSV, external=False, partitions=16, workers=None):
+    if external:
+        return check_duplicate_external(inputCSV, partitions, workers)
     try:
-        df = pd.read_csv(inputCSV)
+        df = read_dataset(inputCSV)
         print(f"samples count: {len(df)}")
     except FileNotFoundError:
         print(f"File: {inputCSV} not found.")
@@ -98,23 +88,44 @@ def check_duplicate(inputCSV):
     print(f"File: {inputCSV} has {duplicate.shape[0]} duplicate samples.")
     if duplicate.shape[0] > 0:
         df_clean = df.drop_duplicates()
-        df_clean.to_csv(inputCSV, index=False)
+        write_dataset(df_clean, inputCSV)
         print(f"Duplicate samples removed from {inputCSV}, samples count: {len(df_clean)}.")
     return inputCSV
 
+def check_duplicate_external(inputCSV, partitions=16, workers=None):
+    """check_duplicate cho file lớn hơn RAM: băm từng dòng ra `partitions` file tạm rồi lọc song song"""
+    if not os.path.exists(inputCSV):
+        print(f"File: {inputCSV} not found.")
+        return None
+    # Ghi ra file tạm cạnh file gốc rồi thay thế, file gốc không bị ghi đè dở dang
+    root, ext = os.path.splitext(inputCSV.rstrip("/\\"))
+    clean_path = f"{root}.dedup{ext}"
+    result = external_dedup([inputCSV], output=clean_path, partitions=partitions, workers=workers)
+    print(f"samples count: {result['rows']}")
+    print(f"File: {inputCSV} has {result['duplicates']} duplicate samples.")
+    if result["duplicates"] > 0:
+        move_dataset(clean_path, inputCSV)
+        print(f"Duplicate samples removed from {inputCSV}, samples count: {result['rows'] - result['duplicates']}.")
+    else:
+        remove_dataset(clean_path)
+    return inputCSV
+
 def check_duplicate_csv_list(inputCSVList):
-    df_list = pd.DataFrame()
+    frames = []
     try:
         for csv in inputCSVList:
-            df = pd.read_csv(csv)
+            df = read_dataset(csv)
             print(f"samples count: {len(df)}")
-            df_list = pd.concat([df_list, df], ignore_index=True)
+            frames.append(df)
+        # Gộp một lần duy nhất thay vì concat lặp lại trong vòng for
+        df_list = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
         print(f"samples count after merge list: {len(df_list)}")
     except FileNotFoundError:
         print(f"File: not found.")
         return None
     duplicate = df_list[df_list.duplicated()]
     print(f"File: list csv has {duplicate.shape[0]} duplicate samples.")
+    df_clean = df_list
     if duplicate.shape[0] > 0:
         df_clean = df_list.drop_duplicates()
         print(f"Duplicate samples removed from merge list, samples count: {len(df_clean)}.")
@@ -132,15 +143,13 @@ def check_dir(inputDir: str):
 def split_dataset_by_label(inputCSVList, outputDir, label = 1, output_file_name = "attack_only_full_set.csv"):
     _, outputDir = check_dir(outputDir)
     save_path = os.path.join(outputDir, output_file_name)
-    df_list = pd.DataFrame()
     try:
-        for csv in inputCSVList:
-            df = pd.read_csv(csv)
-            print(f"samples count: {len(df)}")
-            df_attack_only = df[df['attack'] == label]
-            df_list = pd.concat([df_list, df_attack_only], ignore_index=True)
-        df_list.to_csv(save_path, index=False)
-        print(f"Data with label {label}, total samples: {len(df_list)} saved to: {save_path}")
+        with DatasetWriter(save_path) as writer:
+            for csv in inputCSVList:
+                df = read_dataset(csv)
+                print(f"samples count: {len(df)}")
+                writer.write(df[df['attack'] == label], source=csv)
+        print(f"Data with label {label}, total samples: {writer.rows} saved to: {save_path}")
         check_duplicate(save_path)
     
     except FileNotFoundError as e:
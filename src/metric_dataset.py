@@ -1,16 +1,153 @@
 import pandas as pd
+import numpy as np
 import os
+import shutil
+import tempfile
+from can_store import write_dataset, iter_dataset, label_counts, DEFAULT_BLOCK_ROWS
+from concurrent.futures import ProcessPoolExecutor
+from can_dedup import external_dedup, iter_text_blocks, shared_columns, canonical_block
+
+# Số partition khi ghi hash dòng ra đĩa; mỗi lần chỉ một partition nằm trong RAM
+HASH_PARTITIONS = 16
 def metric_label(inputCSV, label_name = "attack"):
+    # Trả lời từ sidecar index (tạo một lần nếu chưa có), không đọc lại cả file
     try:
-        df = pd.read_csv(inputCSV)
+        counts = label_counts(inputCSV, label_name)
     except FileNotFoundError:
         print(f"File: {inputCSV} not found.")
         return None
-    label_counts = df['attack'].value_counts()
-    total_sample = df.shape[0]
-    return label_counts, total_sample
+    if counts is None:
+        print(f"File: {inputCSV} has no column {label_name}.")
+        return None
+    total_sample = int(counts.sum())
+    return counts, total_sample
+
+def _hash_path(spill_dir, file_id, part):
+    return os.path.join(spill_dir, f"{file_id:05d}-{part:04d}.u64")
+
+
+def _spill_hashes(hashes, spill_dir, file_id, partitions):
+    # Ghi nối tiếp hash 64-bit của từng dòng vào file theo partition (hash % partitions)
+    part = hashes % np.uint64(partitions)
+    for i in np.unique(part).tolist():
+        with open(_hash_path(spill_dir, file_id, i), "ab") as f:
+            hashes[part == i].tofile(f)
+
+
+def _read_hashes(spill_dir, file_ids, part):
+    paths = [_hash_path(spill_dir, file_id, part) for file_id in file_ids]
+    arrays = [np.fromfile(p, dtype=np.uint64) for p in paths if os.path.exists(p)]
+    return np.concatenate(arrays) if arrays else np.empty(0, dtype=np.uint64)
+
+
+def file_stats(path, label_column="attack", chunksize=DEFAULT_BLOCK_ROWS, spill_dir=None, file_id=0,
+               partitions=HASH_PARTITIONS, shared=None):
+    """Thống kê một file trong một lượt đọc theo chunk.
+
+    Trả về số dòng, số mẫu theo label, số dòng trùng (so theo hash 64-bit
+    của dòng) và [count, sum, min, max] của từng cột số. Dòng được hash sau
+    canonical_block trên các cột `shared` (mặc định: cột của file), như
+    external_dedup, nên thứ tự cột và cách viết số ("1" / "1.0") không ảnh
+    hưởng. Hash được ghi ra `spill_dir` theo partition, nên đếm trùng chỉ cần
+    một partition trong RAM; merge_stats dùng lại chúng để đếm trùng giữa các file.
+    """
+    own_dir = spill_dir is None
+    if own_dir:
+        spill_dir = tempfile.mkdtemp(prefix="stats-")
+    shared = shared or shared_columns([path])
+    rows = 0
+    labels = {}
+    columns = None
+    for df in iter_text_blocks(path, chunksize):
+        rows += len(df)
+        canonical = canonical_block(df, shared)
+        _spill_hashes(pd.util.hash_pandas_object(canonical, index=False).to_numpy(), spill_dir, file_id, partitions)
+        if label_column in df.columns:
+            for label, count in canonical[label_column].value_counts().items():
+                labels[label] = labels.get(label, 0) + int(count)
+        if columns is None:
+            columns = {name: None for name in df.columns}
+        for name in list(columns):
+            text = df[name]
+            values = pd.to_numeric(text, errors="coerce")
+            if (values.isna() & (text != "")).any():
+                # Cột không phải số (vd: data_field dạng hex) thì bỏ qua
+                del columns[name]
+                continue
+            values = values.dropna()
+            if not len(values):
+                continue
+            stat = [len(values), float(values.sum()), float(values.min()), float(values.max())]
+            old = columns[name]
+            columns[name] = stat if old is None else [old[0] + stat[0], old[1] + stat[1], min(old[2], stat[2]), max(old[3], stat[3])]
+    unique = sum(len(np.unique(_read_hashes(spill_dir, [file_id], part))) for part in range(partitions))
+    if own_dir:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return {
+        "path": path,
+        "file_id": file_id,
+        "rows": rows,
+        "labels": labels,
+        "duplicates": rows - unique,
+        "columns": {name: stat for name, stat in (columns or {}).items() if stat is not None},
+    }
+
+
+def merge_stats(results, spill_dir=None, partitions=HASH_PARTITIONS):
+    """Gộp kết quả file_stats của nhiều file; trùng giữa các file cần `spill_dir` mà các file đã ghi hash vào"""
+    labels = {}
+    columns = None
+    for result in results:
+        for label, count in result["labels"].items():
+            labels[label] = labels.get(label, 0) + count
+        # Chỉ giữ cột là số trong mọi file
+        names = set(result["columns"]) if columns is None else set(columns) & set(result["columns"])
+        merged = {}
+        for name in names:
+            stat = result["columns"][name]
+            old = (columns or {}).get(name)
+            merged[name] = stat if old is None else [old[0] + stat[0], old[1] + stat[1], min(old[2], stat[2]), max(old[3], stat[3])]
+        columns = merged
+    rows = sum(result["rows"] for result in results)
+    across = None
+    if spill_dir is not None:
+        file_ids = [result["file_id"] for result in results]
+        across = rows - sum(len(np.unique(_read_hashes(spill_dir, file_ids, part))) for part in range(partitions))
+    summary = pd.DataFrame(
+        [{"feature": name, "count": c, "min": lo, "max": hi, "mean": total / c} for name, (c, total, lo, hi) in sorted((columns or {}).items())],
+        columns=["feature", "count", "min", "max", "mean"])
+    return {
+        "rows": rows,
+        "labels": labels,
+        "duplicates": sum(result["duplicates"] for result in results),
+        "duplicates_across_files": across,
+        "summary": summary,
+        "files": {result["path"]: {k: v for k, v in result.items() if k not in ("path", "file_id")} for result in results},
+    }
+
+
+def dataset_stats(paths, label_column="attack", workers=None, chunksize=DEFAULT_BLOCK_ROWS,
+                  partitions=HASH_PARTITIONS, tmp_dir=None):
+    """Thống kê nhiều file song song (mỗi file một process) rồi gộp kết quả.
+
+    Một lượt đọc mỗi file cho: số dòng, label, trùng lặp trong từng file và
+    giữa các file, bảng count/min/max/mean từng cột số (`summary`). Hash dòng
+    được ghi tạm ra đĩa theo partition nên RAM không tăng theo kích thước dữ liệu.
+    """
+    n = len(paths)
+    # Mọi file hash trên cùng danh sách cột để so được dòng giữa các file
+    shared = shared_columns(paths)
+    spill_dir = tempfile.mkdtemp(prefix="stats-", dir=tmp_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(file_stats, paths, [label_column] * n, [chunksize] * n,
+                                        [spill_dir] * n, range(n), [partitions] * n, [shared] * n))
+        return merge_stats(results, spill_dir, partitions)
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
 
-def metric_file_csv(inputCSV_folder):
+def metric_file_csv(inputCSV_folder, external=False, partitions=16, workers=None):
     try:
         csv_amount = len([f for f in os.listdir(inputCSV_folder) if f.endswith(".csv")])
         files = [f for f in os.listdir(inputCSV_folder) if f.endswith(".csv")]
@@ -18,16 +155,29 @@ def metric_file_csv(inputCSV_folder):
         print(f"File: {inputCSV_folder} not found.")
         return None
     count_total = 0
-    for file in files:
-        df = pd.read_csv(os.path.join(inputCSV_folder, file))
-        duplicate = df[df.duplicated()]
-        count_total += df.shape[0]
-        print(f"File: {file} has {duplicate.shape[0]} duplicate samples.")
+    if external:
+        # Đếm trùng lặp trong từng file mà không nạp cả file vào RAM
+        result = external_dedup([os.path.join(inputCSV_folder, f) for f in files],
+                                partitions=partitions, workers=workers, within_source=True)
+        for file, (rows, duplicates) in zip(files, result["per_source"].values()):
+            print(f"File: {file} has {duplicates} duplicate samples.")
+        count_total = result["rows"]
+        print(f"total sample in {inputCSV_folder}: {count_total}")
+        return csv_amount, files, count_total
+    # Đếm số dòng và số dòng trùng bằng một lượt đọc theo chunk, không nạp cả file
+    stats = dataset_stats([os.path.join(inputCSV_folder, f) for f in files], workers=workers)
+    for file, file_stat in zip(files, stats["files"].values()):
+        count_total += file_stat["rows"]
+        print(f"File: {file} has {file_stat['duplicates']} duplicate samples.")
     print(f"total sample in {inputCSV_folder}: {count_total}")
     return csv_amount, files, count_total
 
-def deep_metric_file_csv(inputCSV_folder, output_file):
-    df_list = []
+def deep_metric_file_csv(inputCSV_folder, output_file, workers=None):
+    """Thống kê cả thư mục bằng dataset_stats: mỗi file đọc một lần theo chunk, song song.
+
+    Ghi bảng count/min/max/mean từng cột số ra summary.csv cạnh `output_file`
+    và trả về (tổng số dòng, bảng đó); số dòng trùng tính trên mọi file gộp lại.
+    """
     output_dir = os.path.dirname(output_file)
     if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -38,25 +188,121 @@ def deep_metric_file_csv(inputCSV_folder, output_file):
     except FileNotFoundError:
         print(f"File: {inputCSV_folder} not found.")
         return None
-    try:
-        for file in files:
-            df = pd.read_csv(os.path.join(inputCSV_folder, file))
-            df_list.append(df)
-    except Exception as e:
-        print(f"Error reading files in {inputCSV_folder}: {e}")
-
-    path_output = os.path.join(output_dir, "summary.csv")
-    merged_df = pd.concat(df_list, ignore_index=True)
-    merged_df.to_csv(path_output, index=False)
-
-    df_s = pd.read_csv(path_output)
-    amount = df_s.shape[0]
-    duplicate = df_s[df_s.duplicated()]
-    print(f"File: {output_file} has {duplicate.shape[0]} duplicate samples.")
+
+    stats = dataset_stats([os.path.join(inputCSV_folder, f) for f in files], workers=workers)
+    write_dataset(stats["summary"], os.path.join(output_dir, "summary.csv"))
+    amount = stats["rows"]
+    print(f"File: {output_file} has {stats['duplicates_across_files']} duplicate samples.")
     print(f"total sample in {inputCSV_folder}: {amount}")
-    return amount, df_s
+    return amount, stats["summary"]
+
+class ReservoirBalancer:
+    """Cân bằng label trong một lượt đọc, bộ nhớ bị chặn bởi `capacity` dòng mỗi class.
+
+    Mỗi class được lấy mẫu reservoir (Algorithm R) trong lúc đọc từng chunk.
+    Khi đã biết số dòng của từng class, tổng số mẫu là min(class) * số class,
+    chia theo `ratios` như balance_dataset_label (mặc định 51/49). Không bao
+    giờ lấy mẫu lặp: nếu class nào không đủ dòng (ít hơn target, hoặc vượt
+    `capacity` nên reservoir chỉ giữ `capacity` dòng) thì mọi target được co
+    theo cùng tỉ lệ. Với `weights=True` thì giữ mỗi dòng một lần kèm cột
+    `sample_weight` để bù phần thiếu thay vì co target.
+    """
+
+    def __init__(self, label_column="attack", ratios=None, capacity=1 << 22, seed=42):
+        self.label_column = label_column
+        self.ratios = ratios or {0: 0.51, 1: 0.49}
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.counts = {label: 0 for label in self.ratios}
+        self._reservoirs = {label: None for label in self.ratios}
+        self._columns = None
+
+    def update(self, df):
+        if self._columns is None:
+            self._columns = list(df.columns)
+        labels = df[self.label_column].to_numpy()
+        for label in self.ratios:
+            rows = np.flatnonzero(labels == label)
+            if not len(rows):
+                continue
+            seen = self.counts[label]
+            reservoir = self._reservoirs[label]
+            # Lấp đầy reservoir trước
+            fill = max(0, min(len(rows), self.capacity - seen))
+            if fill:
+                block = {c: df[c].to_numpy()[rows[:fill]] for c in self._columns}
+                if reservoir is None:
+                    reservoir = block
+                else:
+                    reservoir = {c: np.concatenate([reservoir[c], block[c]]) for c in self._columns}
+            # Dòng thứ i (tính từ 0) thay vào ô j ~ U[0, i] nếu j < capacity
+            rest = rows[fill:]
+            if len(rest):
+                positions = np.arange(seen + fill, seen + len(rows))
+                slots = (self.rng.random(len(rest)) * (positions + 1)).astype(np.int64)
+                keep = slots < self.capacity
+                for c in self._columns:
+                    reservoir[c][slots[keep]] = df[c].to_numpy()[rest[keep]]
+            self._reservoirs[label] = reservoir
+            self.counts[label] = seen + len(rows)
+
+    def available(self, label):
+        reservoir = self._reservoirs[label]
+        return 0 if reservoir is None else len(reservoir[self._columns[0]])
+
+    def targets(self, cap=True):
+        """Số mẫu mỗi class; `cap=True` bảo đảm target <= số dòng trong reservoir"""
+        present = [label for label in self.ratios if self.counts[label]]
+        if len(present) < len(self.ratios):
+            # Thiếu class thì không cân bằng được, giữ nguyên số mẫu đang có (tối đa `capacity`)
+            return {label: self.available(label) if cap else self.counts[label] for label in self.ratios}
+        total = min(self.counts.values()) * len(self.ratios)
+        if cap:
+            # Co tổng số mẫu để class nào cũng đủ dòng, giữ nguyên tỉ lệ
+            total = min([total] + [int(self.available(label) / ratio) for label, ratio in self.ratios.items() if ratio > 0])
+        labels = list(self.ratios)
+        targets = {label: int(total * self.ratios[label]) for label in labels[:-1]}
+        targets[labels[-1]] = total - sum(targets.values())
+        if cap:
+            # Sai số làm tròn có thể dồn vào class cuối
+            targets[labels[-1]] = min(targets[labels[-1]], self.available(labels[-1]))
+        return targets
 
-def balance_dataset_label(inputCSV, outputDir, output_file_name = "balanced_dataset.csv"):
+    def result(self, weights=False, shuffle=True):
+        parts = []
+        for label, target in self.targets(cap=not weights).items():
+            reservoir = self._reservoirs[label]
+            if reservoir is None or target == 0:
+                continue
+            available = self.available(label)
+            weight = 1.0
+            if target <= available:
+                picks = self.rng.choice(available, size=target, replace=False)
+            else:
+                # Chỉ xảy ra khi weights=True: giữ mỗi dòng một lần, bù bằng trọng số
+                picks = np.arange(available)
+                weight = target / available
+            part = pd.DataFrame({c: reservoir[c][picks] for c in self._columns})
+            if weights:
+                part["sample_weight"] = weight
+            parts.append(part)
+        if not parts:
+            return pd.DataFrame(columns=self._columns or [])
+        df = pd.concat(parts, ignore_index=True)
+        if shuffle:
+            df = df.iloc[self.rng.permutation(len(df))].reset_index(drop=True)
+        return df
+
+
+def balance_dataset_stream(inputCSV, label_column="attack", ratios=None, weights=False, chunksize=DEFAULT_BLOCK_ROWS):
+    """Đọc dataset theo chunk và cân bằng label bằng ReservoirBalancer"""
+    balancer = ReservoirBalancer(label_column, ratios)
+    for df in iter_dataset(inputCSV, chunksize):
+        balancer.update(df)
+    return balancer.result(weights=weights)
+
+
+def balance_dataset_label(inputCSV, outputDir, output_file_name = "balanced_dataset.csv", weights=False, compression_level=None):
     isExist = not os.path.exists(outputDir) and not os.path.isdir(outputDir)
     if isExist:
         os.makedirs(outputDir)
@@ -65,22 +311,10 @@ def balance_dataset_label(inputCSV, outputDir, output_file_name = "balanced_data
         print(f"📁 Folder already exists: {outputDir}")
     path = os.path.join(outputDir, output_file_name)
     try:
-        df = pd.read_csv(inputCSV)
-        # Lọc theo class
-        df_0 = df[df["attack"] == 0]
-        df_1 = df[df["attack"] == 1]
-
-
-        total_samples = min(len(df_0), len(df_1)) * 2
-        n_0 = int(total_samples * 0.51)
-        n_1 = total_samples - n_0  
-
-        df_0_sampled = df_0.sample(n=n_0, random_state=42)
-        df_1_sampled = df_1.sample(n=n_1, random_state=42, replace=True)  # Cho phép lặp nếu cần
-
-        df_balanced = pd.concat([df_0_sampled, df_1_sampled]).sample(frac=1, random_state=42)  # Shuffle
+        # Lấy mẫu 51/49 trong một lượt đọc; weights=True ghi thêm cột sample_weight thay vì nhân bản dòng
+        df_balanced = balance_dataset_stream(inputCSV, weights=weights)
 
-        df_balanced.to_csv(path, index=False)
+        write_dataset(df_balanced, path, compression_level=compression_level)
 
         print(f"Balanced dataset saved with {len(df_balanced)} rows at {path}")
         label_counts, total_sample = metric_label(path)
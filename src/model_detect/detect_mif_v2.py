@@ -1,5 +1,10 @@
 import os
-import math
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from can_features import PayloadFeatureCache
+
+_feature_cache = PayloadFeatureCache()
 
 def parse_mif_line(line):
     bits = line.strip().replace(' ', '')
@@ -31,30 +36,15 @@ def load_tree_mif(filepath):
                 tree[node['node_id']] = node
     return tree
 
-def calculate_entropy(hex_data):
-    if len(hex_data) % 2 != 0:
-        raise ValueError("Hex data không hợp lệ")
-    byte_data = bytes.fromhex(hex_data)
-    if not byte_data:
-        return 0.0
-    freq = [0] * 256
-    for b in byte_data:
-        freq[b] += 1
-    entropy = 0.0
-    for f in freq:
-        if f > 0:
-            p = f / len(byte_data)
-            entropy -= p * math.log2(p)
-    return entropy
-
 def extract_features(sample):
     arbitration_int = int(sample['arbitration_id'], 16)
-    entropy = calculate_entropy(sample['data_field'])
-    length = len(sample['data_field']) // 2
+    if len(sample['data_field']) % 2 != 0:
+        raise ValueError("Hex data không hợp lệ")
+    entropy, _, length = _feature_cache.lookup(sample['data_field'])
     return {
         0: arbitration_int,
         1: int(entropy * 1000),
-        2: length
+        2: int(length)
     }
 
 def run_tree_prediction(tree_dict, sample_features):
@@ -0,0 +1,161 @@
+import argparse
+import itertools
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import accuracy_score
+from sklearn.model_selection import train_test_split
+
+from can_store import read_dataset, write_dataset
+from train import preprocess_data, max_leaf_nodes_for
+
+# Hardware limits, from hard_ware_new/Random_forest_top_new.v
+NODE_WIDTH = 95        # bits per node row in the tree ROMs
+ROM_DEPTH = 512        # nodes per tree ROM
+TREE_COUNT = 21        # tree instances evaluated in parallel; the top level waits for MIN_VOTES = 21 votes
+PIPELINE_DEPTH = 10    # pipeline stages, also the maximum tree depth
+# Tree FSM: READ_NODE + PROCESS_NODE per level; IDLE/COLLECTING/VOTING/WAIT_PREDICTION around the vote
+CYCLES_PER_LEVEL = 2
+VOTE_CYCLES = 4
+
+DEFAULT_GRID = {
+    # Only TREE_COUNT trees fit the current top level; other counts need TREE_COUNT/MIN_VOTES re-parameterised
+    "n_estimators": [TREE_COUNT],
+    "max_depth": [6, 7, 8, 9, 10],
+    "max_features": ["sqrt", None],
+    "min_samples_leaf": [1, 8],
+    # None grows freely; the cap keeps every tree within ROM_DEPTH nodes
+    "max_leaf_nodes": [None, max_leaf_nodes_for(TREE_COUNT, ROM_DEPTH)],
+}
+
+# Worker-side views of the shared training matrices, set by _attach
+_shared = {}
+
+
+def _share(arrays):
+    """Copy each array into its own shared memory block; return the blocks and a picklable spec"""
+    blocks, spec = [], {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+        blocks.append(block)
+        spec[name] = (block.name, array.shape, array.dtype.str)
+    return blocks, spec
+
+
+def _attach(spec):
+    for name, (block_name, shape, dtype) in spec.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        # Keep the handle alive as long as the view is used
+        _shared[name] = (block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf))
+
+
+def _array(name):
+    return _shared[name][1]
+
+
+def estimate_latency(depths, n_estimators):
+    """Clock cycles to classify one frame: the deepest tree walk, once per batch of TREE_COUNT trees"""
+    passes = math.ceil(n_estimators / TREE_COUNT)
+    return passes * CYCLES_PER_LEVEL * (max(depths) + 1) + VOTE_CYCLES
+
+
+def _evaluate(params):
+    start = time.perf_counter()
+    model = RandomForestClassifier(criterion='gini', random_state=42, n_jobs=1, **params)
+    model.fit(_array("X_train"), _array("y_train"), sample_weight=_array("w_train"))
+    accuracy = accuracy_score(_array("y_test"), model.predict(_array("X_test")))
+
+    node_counts = [tree.tree_.node_count for tree in model.estimators_]
+    depths = [tree.tree_.max_depth for tree in model.estimators_]
+    return {
+        **params,
+        "accuracy": accuracy,
+        "total_nodes": sum(node_counts),
+        "max_tree_nodes": max(node_counts),
+        "max_depth_reached": max(depths),
+        "memory_bits": sum(node_counts) * NODE_WIDTH,
+        "latency_cycles": estimate_latency(depths, params["n_estimators"]),
+        "fits_hardware": (max(node_counts) <= ROM_DEPTH and max(depths) <= PIPELINE_DEPTH
+                          and params["n_estimators"] == TREE_COUNT),
+        "fit_seconds": time.perf_counter() - start,
+    }
+
+
+def expand_grid(grid):
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[n] for n in names))]
+
+
+def pareto_front(results, maximize=("accuracy",), minimize=("total_nodes", "latency_cycles")):
+    """Mark the rows no other row beats on every objective (and strictly on one)"""
+    better = results[list(maximize)].to_numpy(dtype=float)
+    cost = results[list(minimize)].to_numpy(dtype=float)
+    front = np.ones(len(results), dtype=bool)
+    for i in range(len(results)):
+        no_worse = (better >= better[i]).all(axis=1) & (cost <= cost[i]).all(axis=1)
+        strictly = (better > better[i]).any(axis=1) | (cost < cost[i]).any(axis=1)
+        front[i] = not (no_worse & strictly).any()
+    return pd.Series(front, index=results.index, name="pareto")
+
+
+def search(dataset_path, grid=None, workers=None, output_file=None):
+    """Train every configuration of `grid` on a process pool and return the results with a `pareto` column.
+
+    The train/test matrices are placed in shared memory once; workers map
+    them instead of receiving a pickled copy per task.
+    """
+    df = preprocess_data(read_dataset(dataset_path))
+    weights = df.pop('sample_weight') if 'sample_weight' in df.columns else pd.Series(1.0, index=df.index)
+    X = df.drop(columns=['attack', 'timestamp'])
+    y = df['attack']
+    X_train, X_test, y_train, y_test, w_train, _ = train_test_split(
+        X, y, weights, test_size=0.2, random_state=42, stratify=y)
+
+    blocks, spec = _share({
+        "X_train": X_train.to_numpy(dtype=np.float64), "y_train": y_train.to_numpy(),
+        "w_train": w_train.to_numpy(dtype=np.float64),
+        "X_test": X_test.to_numpy(dtype=np.float64), "y_test": y_test.to_numpy(),
+    })
+    candidates = expand_grid(grid or DEFAULT_GRID)
+    rows = []
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(spec,)) as executor:
+            futures = [executor.submit(_evaluate, params) for params in candidates]
+            for i, future in enumerate(as_completed(futures), 1):
+                row = future.result()
+                print(f"[{i}/{len(candidates)}] acc={row['accuracy']:.4f} nodes={row['total_nodes']} "
+                      f"depth={row['max_depth_reached']} cycles={row['latency_cycles']} "
+                      f"{'fits' if row['fits_hardware'] else 'too big'}")
+                rows.append(row)
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = pd.DataFrame(rows)
+    # Only configurations that fit compete: one that does not fit must not push a fitting one off the front
+    fits = results["fits_hardware"].to_numpy(dtype=bool)
+    results["pareto"] = False
+    if fits.any():
+        results.loc[fits, "pareto"] = pareto_front(results[fits])
+    results = results.sort_values(["pareto", "accuracy"], ascending=False, ignore_index=True)
+    if output_file:
+        write_dataset(results, output_file)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Random forest hyperparameter search bounded by the hardware ROMs")
+    parser.add_argument("dataset", nargs="?", default="datasets_release/balanced_dataset.csv")
+    parser.add_argument("-o", "--output", default="datasets_release/hyperparam_search.csv")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    args = parser.parse_args()
+    results = search(args.dataset, workers=args.workers, output_file=args.output)
+    print(results[results["pareto"]].to_string(index=False))
@@ -7,22 +7,52 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix
 from sklearn.preprocessing import LabelEncoder
 import joblib
+from can_store import read_dataset, downcast_features
+from can_features import decode_payload, payload_to_int
+
+# Dòng MIF 95 bit (model_detect/convert_to_mif.py) dùng 9 bit cho node ID và con trái/phải
+NODE_ADDRESS_BITS = 9
+MAX_TREE_NODES = 1 << NODE_ADDRESS_BITS
 
 def preprocess_data(df):
     # Tiền xử lý dữ liệu
     df = df.copy()
     
     # Xử lý các cột hex nếu cần
-    for col in ['arbitration_id', 'data_field']:
-        if df[col].dtype == object:
-            # Chuyển hex sang số nguyên
-            df[col] = df[col].apply(lambda x: int(x, 16) if isinstance(x, str) else x)
+    if not pd.api.types.is_numeric_dtype(df['arbitration_id']):
+        # Chuyển hex sang số nguyên
+        df['arbitration_id'] = df['arbitration_id'].apply(lambda x: int(x, 16) if isinstance(x, str) else x)
+    if not pd.api.types.is_numeric_dtype(df['data_field']):
+        # Giải mã cả cột payload một lần thay vì int(x, 16) từng dòng
+        df['data_field'] = payload_to_int(*decode_payload(df['data_field']))
     
-    return df
+    # Đặc trưng float32 chỉ trong bộ nhớ (cây quyết định vốn so sánh bằng float32)
+    return downcast_features(df)
+
+def max_leaf_nodes_for(n_estimators, tree_node_budget=MAX_TREE_NODES, forest_node_budget=None):
+    """Số lá tối đa mỗi cây để cả rừng nằm trong ngân sách node (cây nhị phân L lá có 2L-1 node)"""
+    budget = tree_node_budget
+    if forest_node_budget is not None:
+        budget = min(budget, forest_node_budget // n_estimators)
+    leaves = (budget + 1) // 2
+    if leaves < 2:
+        raise ValueError(f"Ngân sách node quá nhỏ: {budget} node/cây cho {n_estimators} cây")
+    return leaves
+
+def check_node_budget(model, tree_node_budget=MAX_TREE_NODES, forest_node_budget=None):
+    """Kiểm tra mô hình đã fit có vừa bộ nhớ MIF không; trả về số node của từng cây"""
+    node_counts = [tree.tree_.node_count for tree in model.estimators_]
+    too_big = [i for i, count in enumerate(node_counts) if count > tree_node_budget]
+    if too_big:
+        raise ValueError(f"Cây {too_big} vượt quá {tree_node_budget} node")
+    if forest_node_budget is not None and sum(node_counts) > forest_node_budget:
+        raise ValueError(f"Tổng {sum(node_counts)} node vượt quá ngân sách rừng {forest_node_budget}")
+    return node_counts
 
-def train_and_visualize():
+def train_and_visualize(dataset_path="datasets_release/balanced_dataset.csv",
+                        tree_node_budget=MAX_TREE_NODES, forest_node_budget=None):
     # Đọc dữ liệu
-    df = pd.read_csv("datasets_release/balanced_dataset.csv")
+    df = read_dataset(dataset_path)
     
     # Tiền xử lý
     df = preprocess_data(df)
@@ -34,25 +64,33 @@ def train_and_visualize():
     print(df.info())
     
     # Chuẩn bị features và target
+    # Dataset cân bằng bằng trọng số (balance_dataset_label(weights=True)) có cột sample_weight
+    weights = df.pop('sample_weight') if 'sample_weight' in df.columns else pd.Series(1.0, index=df.index)
     X = df.drop(columns=['attack', 'timestamp'])  # Bỏ timestamp nếu không cần
     y = df['attack']
     
     # Chia tập dữ liệu
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y)
+    X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+        X, y, weights, test_size=0.2, random_state=42, stratify=y)
     
     # Huấn luyện mô hình
+    # max_leaf_nodes làm cây phát triển best-first: tách lá giảm impurity nhiều nhất trước,
+    # nên trong cùng ngân sách node sẽ giữ lại các nhánh có ích nhất
+    n_estimators = 21
     model = RandomForestClassifier(
-        n_estimators=21,  # Tăng số cây để cải thiện hiệu suất
+        n_estimators=n_estimators,  # Tăng số cây để cải thiện hiệu suất
         min_samples_split=2,
         criterion='gini',
         random_state=42,
         max_depth=9,  # Để cây phát triển tự nhiên
         max_features='sqrt',  # Tốt cho dữ liệu phân loại
+        max_leaf_nodes=max_leaf_nodes_for(n_estimators, tree_node_budget, forest_node_budget),
         n_jobs=-1  # Sử dụng tất cả CPU
     )
     
-    model.fit(X_train, y_train)
+    model.fit(X_train, y_train, sample_weight=w_train)
+    node_counts = check_node_budget(model, tree_node_budget, forest_node_budget)
+    print(f"\nNodes per tree: max {max(node_counts)}/{tree_node_budget}, total {sum(node_counts)}")
     
     # Lưu mô hình
     joblib.dump(model, "datasets_release/can-data-w.pkl")
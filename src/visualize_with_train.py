@@ -1,14 +1,14 @@
-import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
 from sklearn.model_selection import train_test_split
+from can_store import read_dataset
 
 # Đọc dữ liệu từ file CSV
 def load_data(file_path):
-    df = pd.read_csv(file_path)
+    df = read_dataset(file_path)
     return df
 
 # Vẽ biểu đồ Accuracy theo số lượng cây trong Random Forest
@@ -43,6 +43,19 @@ def plot_feature_importance(model, feature_names):
     plt.savefig("feature_importance.png")
     plt.show()
 
+# Huấn luyện một forest duy nhất, thêm cây dần (warm_start) và đo accuracy tại mỗi mốc.
+# Cùng random_state nên n cây đầu giống hệt forest n cây huấn luyện từ đầu.
+def sweep_estimators(X_train, y_train, X_test, y_test, estimators, **params):
+    model = RandomForestClassifier(warm_start=True, **params)
+    accuracies = []
+    for n in sorted(estimators):
+        model.set_params(n_estimators=n)
+        model.fit(X_train, y_train)
+        accuracies.append(model.score(X_test, y_test))
+    # Trả về forest cuối cùng để dùng tiếp, tắt warm_start cho các lần fit sau
+    model.set_params(warm_start=False)
+    return model, accuracies
+
 # Hàm chính để huấn luyện và vẽ biểu đồ
 def main(csv_file):
     df = load_data(csv_file)
@@ -57,17 +70,10 @@ def main(csv_file):
     # Chia tập train/test
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
-    # Huấn luyện với số lượng cây khác nhau
+    # Huấn luyện với số lượng cây khác nhau: chỉ 100 cây được fit, mô hình cuối cùng là forest của mốc lớn nhất
     estimators = [1, 5, 10, 50, 100]
-    accuracies = []
-    for n in estimators:
-        model = RandomForestClassifier(n_estimators=n, random_state=42, min_samples_split=2, criterion='gini')
-        model.fit(X_train, y_train)
-        accuracies.append(model.score(X_test, y_test))
-    
-    # Huấn luyện mô hình cuối cùng
-    final_model = RandomForestClassifier(n_estimators=100, random_state=42, min_samples_split=2, criterion='gini')
-    final_model.fit(X_train, y_train)
+    final_model, accuracies = sweep_estimators(X_train, y_train, X_test, y_test, estimators,
+                                               random_state=42, min_samples_split=2, criterion='gini')
     y_pred = final_model.predict(X_test)
     
     # Vẽ các biểu đồ
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+
+from can_dedup import external_dedup
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_dedup_matches_duplicated_across_sources(tmp_path):
+    a = _write(tmp_path / "a.csv", "timestamp,arbitration_id,data_field,attack\n"
+                                   "1.0,0100,00,0\n2.5,0350,0000,1\n1.0,0100,00,0\n3,07ff,ff,0\n")
+    # Reordered columns, "1" vs "1.0" spelling and a column the first file lacks
+    b = _write(tmp_path / "b.csv", "attack,data_field,timestamp,arbitration_id,extra\n"
+                                   "0,00,1,0100,\n1,0000,2.50,0350,\n0,00,1,0100,x\n1,00,2.5,0350,\n")
+    output = str(tmp_path / "out.csv")
+    result = external_dedup([a, b], output, partitions=4, workers=2)
+
+    # By value: b's first two rows repeat a's rows 0 and 1 once spellings and column order are ignored
+    assert result["duplicates"] == 3
+    assert result["per_source"] == {a: (4, 1), b: (4, 2)}
+
+    kept = pd.read_csv(output, dtype=str, keep_default_na=False)
+    assert list(kept.columns) == ["timestamp", "arbitration_id", "data_field", "attack", "extra"]
+    assert kept["data_field"].tolist() == ["00", "0000", "ff", "00", "00"]
+    assert kept["extra"].tolist() == ["", "", "", "x", ""]
+
+
+def test_dedup_matches_duplicated_on_one_file(tmp_path):
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({"timestamp": rng.integers(0, 50, 3000) / 4, "arbitration_id": rng.integers(0, 5, 3000),
+                       "data_field": rng.choice(["00", "0000", "ff", "0a0b"], 3000)})
+    path = tmp_path / "a.csv"
+    df.to_csv(path, index=False)
+    result = external_dedup(str(path), str(tmp_path / "out.csv"), partitions=8, workers=2, chunksize=500)
+    expected = pd.read_csv(path, dtype={"data_field": str}).duplicated()
+    assert result["duplicates"] == int(expected.sum())
+    kept = pd.read_csv(tmp_path / "out.csv", dtype={"data_field": str})
+    pd.testing.assert_frame_equal(kept, df[~expected.to_numpy()].reset_index(drop=True))
@@ -0,0 +1,174 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from can_features import PayloadFeatureCache, data_field_entropy, decode_payload, payload_features, payload_to_int
+
+
+def _reference_entropy(data_field):
+    # Per-row helper used by the converters before the vectorized version
+    try:
+        data = bytes.fromhex(str(data_field))
+    except ValueError:
+        return 0.0
+    if not data:
+        return 0.0
+    counts = pd.Series(list(data)).value_counts()
+    return -sum((c / len(data)) * math.log2(c / len(data)) for c in counts)
+
+
+def test_decode_payload_matches_row_by_row():
+    values = pd.Series(["052884666D0000A2", "00", "0A 1B 2C", "", None, "ff", "123"])
+    payload, length = decode_payload(values)
+    assert payload.shape == (len(values), 8)
+    expected_length = [len(str(v).replace(" ", "")) // 2 if isinstance(v, str) else 0 for v in values]
+    assert length.tolist() == expected_length
+    assert payload[0].tobytes() == bytes.fromhex("052884666D0000A2")
+    assert payload[2, :3].tolist() == [0x0A, 0x1B, 0x2C]
+    assert payload_to_int(payload, length)[0] == int("052884666D0000A2", 16)
+
+
+def test_entropy_matches_reference():
+    rng = np.random.default_rng(0)
+    values = ["".join(f"{b:02x}" for b in rng.integers(0, 4, rng.integers(0, 9))) for _ in range(500)]
+    expected = [round(_reference_entropy(v), 6) for v in values]
+    assert np.allclose(data_field_entropy(pd.Series(values), decimals=6), expected)
+
+
+def test_empty_column_decodes_to_empty_matrix():
+    for values in (pd.Series([], dtype=object), pd.Series([], dtype="category"), []):
+        payload, length = decode_payload(values)
+        assert payload.shape == (0, 8)
+        assert length.shape == (0,)
+    features = payload_features(pd.Series([], dtype=object))
+    assert all(len(column) == 0 for column in features.values())
+
+
+def _groupby_inter_arrival(ids, timestamps, decimals=6):
+    df = pd.DataFrame({"arbitration_id": ids, "timestamp": timestamps})
+    return df.groupby("arbitration_id")["timestamp"].diff().fillna(0).round(decimals).to_numpy()
+
+
+@pytest.mark.parametrize("value", ["0G", "0A\u00e9", "0x0A", "00" * 9, "00 " * 9 + "00"])
+def test_invalid_payload_raises(value):
+    with pytest.raises(ValueError, match="data_field"):
+        decode_payload(pd.Series(["0A0B", value]))
+
+
+def test_missing_payload_keeps_old_dls():
+    # The old lambda len(str(x).replace(" ", "")) // 2 gave 1 for NaN ("nan")
+    values = pd.Series(["0A0B", None, "0C"], dtype=object)
+    assert payload_features(values)["dls"].tolist() == [2, 1, 1]
+    cache = PayloadFeatureCache()
+    assert cache.features(values)["dls"].tolist() == [2, 1, 1]
+    assert cache.lookup(np.nan)[2] == 1
+    assert decode_payload(values)[1].tolist() == [2, 0, 1]
+
+
+def _reference_bit_flipping(x):
+    # CANDataProcessor._calc_bit_flipping before the popcount table
+    if not isinstance(x, str):
+        return 0.0
+    try:
+        bits = sum(bin(int(x[i:i+2], 16)).count('1') for i in range(0, len(x), 2) if x[i:i+2].isalnum())
+        return bits / (len(x) * 4)
+    except Exception:
+        return 0.0
+
+
+def test_bit_flip_rate_matches_reference():
+    values = ["00", "FF", "0A0B0C", "ABC", "f", "123456789ABCDEF0", "8", "", None]
+    rates = payload_features(pd.Series(values, dtype=object))["bit_flipping_rate"]
+    assert np.allclose(rates, [_reference_bit_flipping(v) for v in values])
+
+
+def test_bit_flip_rate_strips_separators():
+    # Spaced payloads are normalised like dls; the old loop skipped the " 1" pair and counted spaces as bits
+    (rate,) = payload_features(["0A 1B"])["bit_flipping_rate"]
+    assert rate == 6 / 16
+    assert _reference_bit_flipping("0A 1B") == 5 / 20
+
+
+def test_inter_arrival_matches_groupby_diff():
+    from can_features import InterArrivalTracker
+    rng = np.random.default_rng(0)
+    # Standard IDs, 29-bit extended IDs and missing IDs in one capture
+    ids = rng.choice([0x100, 0x350, 0x7FF, 0x18FEF100, 0x1FFFFFFF, np.nan], size=2000)
+    timestamps = np.cumsum(rng.random(2000) * 1e-3)
+    expected = _groupby_inter_arrival(ids, timestamps)
+
+    tracker = InterArrivalTracker()
+    batched = np.concatenate([tracker.update_many(ids[i:i + 300], timestamps[i:i + 300]) for i in range(0, 2000, 300)])
+    assert np.allclose(batched, expected)
+
+    tracker = InterArrivalTracker()
+    per_frame = [tracker.update(i, t) for i, t in zip(ids, timestamps)]
+    assert np.allclose(per_frame, expected)
+
+
+def test_inter_arrival_keeps_out_of_range_ids_apart():
+    from can_features import InterArrivalTracker
+    tracker = InterArrivalTracker(id_space=4)
+    # -1 must not wrap onto slot 3, and both entry points share the same slots
+    assert tracker.update(3, 1.0) == 0.0
+    assert tracker.update(-1, 2.0) == 0.0
+    assert tracker.update_many([3, -1, 5], [4.0, 6.0, 7.0]).tolist() == [3.0, 4.0, 0.0]
+    assert tracker.update(5, 7.5) == 0.5
+
+
+def test_window_stats_match_brute_force_with_extended_ids():
+    from can_features import WindowStats
+    rng = np.random.default_rng(1)
+    ids = rng.choice([0x100, 0x350, 0x18FEF100, np.nan], size=400)
+    timestamps = np.cumsum(rng.random(400) * 1e-3)
+    deltas = rng.random(400) * 1e-3
+    mean, var, entropy = WindowStats(window=50).update_many(ids, timestamps, deltas)
+    for i in range(400):
+        window = slice(max(0, i - 49), i + 1)
+        counts = pd.Series(ids[window]).value_counts(dropna=False).to_numpy() / (i + 1 - window.start)
+        assert np.isclose(mean[i], deltas[window].mean())
+        assert np.isclose(var[i], deltas[window].var(), atol=1e-12)
+        assert np.isclose(entropy[i], -(counts * np.log2(counts)).sum(), atol=1e-9)
+
+
+def test_bit_flips_match_per_id_previous_payload():
+    from can_features import BitFlipTracker
+    rng = np.random.default_rng(2)
+    ids = rng.choice([0x100, 0x7FF, 0x18FEF100, -1, np.nan], size=600)
+    payload = rng.integers(0, 256, size=(600, 8), dtype=np.uint8)
+
+    expected, last = [], {}
+    for i, key in enumerate(ids):
+        if np.isnan(key):
+            expected.append(0)
+            continue
+        previous = last.get(key)
+        expected.append(0 if previous is None else int(np.unpackbits(previous ^ payload[i]).sum()))
+        last[key] = payload[i]
+
+    tracker = BitFlipTracker()
+    batched = np.concatenate([tracker.update_many(ids[i:i + 128], payload[i:i + 128]) for i in range(0, 600, 128)])
+    assert batched.tolist() == expected
+    tracker = BitFlipTracker()
+    assert [tracker.update(key, row) for key, row in zip(ids, payload)] == expected
+
+
+def _replay_flags(frames, **kwargs):
+    from can_features import ReplayDetector
+    detector = ReplayDetector(**kwargs)
+    return [detector.update(i, payload, ts) for ts, i, payload in sorted(frames)]
+
+
+def test_periodic_constant_payload_is_not_a_replay():
+    # 2 ms and 10 ms IDs with constant payloads: a fixed 10 ms window flagged every frame of both
+    frames = [(k * 0.002, 0x100, b"\x01") for k in range(1000)] + [(k * 0.010, 0x200, b"\x02") for k in range(200)]
+    assert not any(_replay_flags(frames))
+
+
+def test_injected_repeat_is_a_replay():
+    genuine = [(k * 0.010, 0x200, b"\x02") for k in range(100)]
+    injected = [(0.5003, 0x200, b"\x02"), (0.7004, 0x200, b"\x02")]
+    flags = dict(zip(sorted(genuine + injected), _replay_flags(genuine + injected)))
+    assert [frame for frame, flagged in flags.items() if flagged] == sorted(injected)
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from can_reader import build_log_index, iter_can_chunks, raw_log_format, read_time_range, sniff_format
+
+CANDUMP = b"".join(b"(%.6f) can0 %03X#%016X\n" % (1.0 + i * 0.01, 0x100 + i % 3, i) for i in range(500))
+TIMESTAMP_LOG = b"".join(b"Timestamp: %.6f        ID: %04x    000    DLC: 2    %02x %02x\n" % (1.0 + i * 0.01, i % 5, i % 256, 7)
+                         for i in range(50))
+
+
+@pytest.fixture
+def logs(tmp_path):
+    paths = {"candump": tmp_path / "a.log", "timestamp": tmp_path / "b.log", "csv": tmp_path / "c.csv"}
+    paths["candump"].write_bytes(CANDUMP)
+    paths["timestamp"].write_bytes(TIMESTAMP_LOG)
+    paths["csv"].write_text("timestamp,arbitration_id,data_field,attack\n1.0,0100,00ff,0\n")
+    return paths
+
+
+def test_sniff_format(logs):
+    for fmt, path in logs.items():
+        assert sniff_format(path) == fmt
+
+
+def test_csv_is_rejected_as_raw_log(logs):
+    assert raw_log_format(logs["candump"]) == "candump"
+    with pytest.raises(ValueError, match="Not a raw CAN log"):
+        raw_log_format(logs["csv"])
+    with pytest.raises(ValueError, match="Not a raw CAN log"):
+        build_log_index(logs["csv"])
+    with pytest.raises(ValueError, match="Not a raw CAN log"):
+        list(read_time_range(logs["csv"], 0, 2))
+
+
+def test_chunks_decode_both_formats(logs):
+    chunks = list(iter_can_chunks(logs["candump"], chunk_size=128))
+    assert [len(c["timestamp"]) for c in chunks] == [128, 128, 128, 116]
+    payload = np.concatenate([c["payload"] for c in chunks])
+    assert payload[499].tobytes() == (499).to_bytes(8, "big")
+
+    (chunk,) = iter_can_chunks(logs["timestamp"])
+    assert chunk["dlc"].tolist() == [2] * 50
+    assert chunk["payload"][3, :2].tolist() == [3, 7]
+
+
+def test_read_time_range_matches_full_scan(logs):
+    full = np.concatenate([c["timestamp"] for c in iter_can_chunks(logs["candump"])])
+    start, end = 2.005, 3.5
+    ranged = np.concatenate([c["timestamp"] for c in read_time_range(logs["candump"], start, end, chunk_size=64)])
+    assert ranged.tolist() == full[(full >= start) & (full <= end)].tolist()
+
+
+def test_csv_hex_columns_are_never_decimal(tmp_path):
+    path = tmp_path / "digits.csv"
+    path.write_text("timestamp,arbitration_id,data_field,attack\n"
+                    "1.0,0350,0000000000000000,0\n"
+                    "1.1,0351,,0\n"
+                    "1.2,,0102,0\n"
+                    "1.3,02A0,0A0B,1\n")
+    # One row per chunk: every chunk infers its own dtypes
+    chunks = list(iter_can_chunks(path, chunk_size=1))
+    assert len(chunks) == 3
+    ids = np.concatenate([c["arbitration_id"] for c in chunks])
+    assert ids.tolist() == [0x350, 0x351, 0x2A0]
+    assert np.concatenate([c["dlc"] for c in chunks]).tolist() == [8, 0, 2]
+    assert np.concatenate([c["label"] for c in chunks]).tolist() == [0, 0, 1]
+
+
+def test_read_time_range_spans_blocks_with_equal_timestamps(tmp_path):
+    path = tmp_path / "ties.log"
+    stamps = [1, 1, 1, 2, 2, 2, 2, 3, 3, 3]
+    path.write_bytes(b"".join(b"(%.6f) can0 100#%02X\n" % (t, i) for i, t in enumerate(stamps)))
+    build_log_index(path, every=4)
+    ranged = np.concatenate([c["payload"][:, 0] for c in read_time_range(path, 2.0, 2.0)])
+    assert ranged.tolist() == [3, 4, 5, 6]
+
+
+def test_timestamp_log_keeps_zero_length_frames(tmp_path):
+    path = tmp_path / "dlc0.log"
+    path.write_bytes(b"Timestamp: 1.000000        ID: 0350    000    DLC: 0\n"
+                     b"Timestamp: 1.010000        ID: 0351    000    DLC: 2    0a 0b\n"
+                     b"Timestamp: 1.020000        ID: 0352    000    DLC: 1    0c 0d\n")
+    assert sniff_format(path) == "timestamp"
+    (chunk,) = iter_can_chunks(path)
+    assert chunk["arbitration_id"].tolist() == [0x350, 0x351, 0x352]
+    assert chunk["dlc"].tolist() == [0, 2, 1]
+    assert chunk["payload"][:, :2].tolist() == [[0, 0], [10, 11], [12, 0]]
@@ -0,0 +1,229 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import can_store
+from can_store import (DatasetWriter, ShardedStore, apply_schema, build_dataset_index, downcast_features,
+                       iter_dataset, label_counts, load_dataset_index, read_dataset, read_row_block,
+                       sample_rows, write_dataset)
+
+
+def test_schema_keeps_float_features_exact(tmp_path):
+    source = tmp_path / "a.csv"
+    pd.DataFrame({"timestamp": [1.0], "inter_arrival_time": [0.02], "data_entropy": [1.918296],
+                  "attack": [1]}).to_csv(source, index=False)
+    df = read_dataset(source)
+    assert df["inter_arrival_time"].dtype == np.float64
+    assert df["attack"].dtype == np.uint8
+
+    other = pd.DataFrame({"timestamp": [2.0], "inter_arrival_time": [0.03], "data_entropy": [0.5], "attack": [0]})
+    target = tmp_path / "b.csv"
+    write_dataset(pd.concat([df, other], ignore_index=True), target)
+    assert target.read_text().splitlines()[1:] == ["1.0,0.02,1.918296,1", "2.0,0.03,0.5,0"]
+
+
+def test_downcast_features_is_in_memory_only():
+    df = pd.DataFrame({"timestamp": [1.5], "inter_arrival_time": [0.02]})
+    small = downcast_features(df)
+    assert small["inter_arrival_time"].dtype == np.float32
+    assert small["timestamp"].dtype == np.float64
+    assert df["inter_arrival_time"].dtype == np.float64
+
+
+def _digest_all(cache_dir, paths):
+    from can_store import BuildCache
+    cache = BuildCache(cache_dir, "spec")
+    return [cache.digest(path) for path in paths]
+
+
+def test_build_cache_memo_survives_parallel_builders(tmp_path):
+    import json
+    from concurrent.futures import ProcessPoolExecutor
+    from can_store import BuildCache, file_digest
+
+    files = []
+    for i in range(8):
+        path = tmp_path / f"in{i}.csv"
+        path.write_text(f"a,b\n{i},{i}\n")
+        files.append(str(path))
+    cache_dir = str(tmp_path / "cache")
+
+    # Unprimed workers each hash their own files and must not drop each other's entries
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_digest_all, [cache_dir] * 4, [files[i::4] for i in range(4)]))
+    with open(tmp_path / "cache" / BuildCache.MEMO_FILE) as f:
+        memo = json.load(f)
+    assert {entry[2] for entry in memo.values()} == {file_digest(path) for path in files}
+
+    # A primed memo is only read by the workers
+    extra = tmp_path / "extra.csv"
+    extra.write_text("a,b\n9,9\n")
+    BuildCache(cache_dir, "spec").prime(files + [str(extra)])
+    memo_file = tmp_path / "cache" / BuildCache.MEMO_FILE
+    before = memo_file.stat().st_mtime_ns
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_digest_all, [cache_dir] * 4, [files[i::4] + [str(extra)] for i in range(4)]))
+    assert memo_file.stat().st_mtime_ns == before
+
+
+def _frame(rows=250, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "timestamp": np.round(np.cumsum(rng.random(rows)), 6),
+        "arbitration_id": rng.choice(["0x0C9", "0x1F1", "0x3E9"], rows),
+        "data_field": [f"{v:016X}" for v in rng.integers(0, 1 << 62, rows)],
+        "inter_arrival_time": np.round(rng.random(rows), 4),
+        "attack": rng.integers(0, 2, rows),
+    })
+
+
+def _assert_same(left, right):
+    """Equal values with equal numeric dtypes; categories depend on which rows were read, so text is compared as str"""
+    def plain(df):
+        df = df.reset_index(drop=True)
+        return pd.DataFrame({name: (df[name].astype(str).to_numpy(dtype=object) if df[name].dtype.kind not in "biuf"
+                                    else np.asarray(df[name])) for name in df.columns})
+    pd.testing.assert_frame_equal(plain(left), plain(right), check_exact=True)
+
+
+@pytest.fixture
+def small_blocks(monkeypatch):
+    # A few rows per index block so every test spans several blocks
+    monkeypatch.setattr(can_store, "INDEX_BLOCK_ROWS", 64)
+    return 64
+
+
+def _as_read_csv(df, tmp_path):
+    # What the old pandas code got back from to_csv + read_csv
+    path = tmp_path / "reference.csv"
+    df.to_csv(path, index=False)
+    return read_dataset(path)
+
+
+def test_columnar_round_trip(tmp_path):
+    df = _frame()
+    path = str(tmp_path / "data.cols")
+    write_dataset(df, path)
+    back = read_dataset(path)
+    _assert_same(back, apply_schema(df))
+    _assert_same(read_dataset(path, usecols=["attack"]), back[["attack"]])
+    _assert_same(pd.concat(iter_dataset(path, chunksize=100)), back)
+
+
+def test_columnar_append_matches_concat(tmp_path):
+    df = _frame()
+    path = str(tmp_path / "data.cols")
+    write_dataset(df.iloc[:100], path)
+    with DatasetWriter(path, append=True) as writer:
+        writer.write(df.iloc[100:], source="rest")
+    back = read_dataset(path)
+    _assert_same(back, apply_schema(df))
+    assert load_dataset_index(path)["rows"] == len(df)
+
+
+def test_sharded_store_round_trip(tmp_path):
+    df = _frame()
+    store = ShardedStore(str(tmp_path / "data.shards"))
+    store.add(df.iloc[:100], vehicle="a", source="one.csv")
+    store.add(df.iloc[100:], vehicle="b", source="two.csv")
+    assert store.rows == len(df)
+    assert store.label_counts() == {str(k): v for k, v in df["attack"].value_counts().items()}
+    _assert_same(store.read(vehicle="b"), apply_schema(df.iloc[100:]))
+
+    store.remove(vehicle="a")
+    reopened = ShardedStore(store.path)
+    assert reopened.rows == len(df) - 100
+    assert len(os.listdir(store.path)) == 2
+
+    exported = str(tmp_path / "export.csv")
+    assert reopened.export(exported) == len(df) - 100
+    _assert_same(read_dataset(exported), _as_read_csv(df.iloc[100:], tmp_path))
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".csv.zst"])
+def test_csv_round_trip(tmp_path, small_blocks, suffix):
+    if suffix == ".csv.zst":
+        pytest.importorskip("zstandard")
+    df = _frame()
+    path = str(tmp_path / f"data{suffix}")
+    write_dataset(df, path)
+    expected = _as_read_csv(df, tmp_path)
+    _assert_same(read_dataset(path), expected)
+    _assert_same(pd.concat(iter_dataset(path, chunksize=100)), expected)
+    if suffix == ".csv.gz":
+        # Concatenated gzip members are still one valid gzip file
+        with gzip.open(path, "rt") as f:
+            assert f.read() == df.to_csv(index=False)
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz", ".csv.zst"])
+def test_index_blocks_match_pandas_slices(tmp_path, small_blocks, suffix):
+    if suffix == ".csv.zst":
+        pytest.importorskip("zstandard")
+    df = _frame()
+    path = str(tmp_path / f"data{suffix}")
+    write_dataset(df, path)
+    expected = _as_read_csv(df, tmp_path)
+
+    index = load_dataset_index(path)
+    assert index["rows"] == len(df)
+    assert len(index["blocks"]) == -(-len(df) // small_blocks)
+    for block in range(len(index["blocks"])):
+        _assert_same(apply_schema(read_row_block(path, block)),
+                     expected.iloc[block * small_blocks:(block + 1) * small_blocks])
+
+    counts = label_counts(path)
+    pd.testing.assert_series_equal(counts.sort_index(), df["attack"].value_counts().sort_index(),
+                                   check_names=False, check_index_type=False)
+
+    picked = np.sort(np.random.default_rng(7).choice(len(df), size=30, replace=False))
+    _assert_same(apply_schema(sample_rows(path, 30, seed=7)), expected.iloc[picked])
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz"])
+def test_csv_append_keeps_index(tmp_path, small_blocks, suffix):
+    df = _frame()
+    path = str(tmp_path / f"data{suffix}")
+    write_dataset(df.iloc[:100], path)
+    with DatasetWriter(path, append=True) as writer:
+        writer.write(df.iloc[100:])
+    expected = _as_read_csv(df, tmp_path)
+    _assert_same(read_dataset(path), expected)
+
+    index = load_dataset_index(path)
+    assert index["rows"] == len(df)
+    last = len(index["blocks"]) - 1
+    _assert_same(apply_schema(read_row_block(path, last)), expected.iloc[last * small_blocks:])
+    if suffix == ".csv":
+        # Offsets kept while appending equal those of a fresh scan
+        assert build_dataset_index(path)["blocks"] == index["blocks"]
+
+
+def test_stale_index_is_rebuilt(tmp_path, small_blocks):
+    path = tmp_path / "data.csv"
+    _frame().to_csv(path, index=False)
+    assert load_dataset_index(str(path))["rows"] == 250
+    _frame(rows=70, seed=1).to_csv(path, index=False)
+    index = load_dataset_index(str(path))
+    assert index["rows"] == 70
+    assert len(index["blocks"]) == 2
+
+
+def test_sharded_store_replace_keeps_manifest_order(tmp_path):
+    df = _frame(rows=30)
+    store = ShardedStore(str(tmp_path / "data.shards"))
+    for i in range(3):
+        store.add(df.iloc[10 * i:10 * (i + 1)], source=f"{i}.csv")
+    old_file = store.find(source="0.csv")[0]["file"]
+
+    entry = store.replace(df.iloc[:5], info={"sha256": "x"}, source="0.csv")
+    assert [shard["source"] for shard in ShardedStore(store.path).shards] == ["0.csv", "1.csv", "2.csv"]
+    assert entry["rows"] == 5 and entry["sha256"] == "x"
+    assert not os.path.exists(os.path.join(store.path, old_file))
+    _assert_same(store.read(), apply_schema(pd.concat([df.iloc[:5], df.iloc[10:]])))
+
+    store.replace(df.iloc[:1], source="3.csv")
+    assert store.shards[-1]["source"] == "3.csv"
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from can_store import ShardedStore, read_dataset
+from convertToCSV3 import build_store
+
+
+def _capture(path, rows):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    pd.DataFrame({"timestamp": [0.1 * i for i in range(rows)], "arbitration_id": ["0x0C9"] * rows,
+                  "data_field": ["0A0B"] * rows}).to_csv(path, index=False)
+
+
+def test_rebuild_without_cache_replaces_changed_files_in_place(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _capture(tmp_path / "src" / "car" / "attack-free" / "a.csv", 2)
+    _capture(tmp_path / "src" / "car" / "attack-free" / "b.csv", 2)
+    store = build_store(ShardedStore(str(tmp_path / "data.shards")), ["car"], parallel=False, cache_dir=None)
+    assert store.rows == 4
+
+    _capture(tmp_path / "src" / "car" / "attack-free" / "a.csv", 3)
+    store = build_store(ShardedStore(store.path), ["car"], parallel=False, cache_dir=None)
+    assert store.rows == 5
+    assert [shard["source"].rsplit("/", 1)[-1] for shard in store.shards] == ["a.csv", "b.csv"]
+
+    fresh = build_store(ShardedStore(str(tmp_path / "fresh.shards")), ["car"], parallel=False, cache_dir=None)
+    pd.testing.assert_frame_equal(read_dataset(store.path), read_dataset(fresh.path))
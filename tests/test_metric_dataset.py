@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+from can_store import write_dataset
+from metric_dataset import ReservoirBalancer, balance_dataset_stream, dataset_stats, deep_metric_file_csv
+
+
+def _write_files(tmp_path):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(3):
+        df = pd.DataFrame({"arbitration_id": rng.integers(0, 4, 400), "dls": rng.integers(0, 3, 400),
+                           "data_field": rng.choice(["00", "0a0b"], 400), "attack": rng.integers(0, 2, 400)})
+        df.to_csv(tmp_path / f"f{i}.csv", index=False)
+        frames.append(df)
+    return [str(tmp_path / f"f{i}.csv") for i in range(3)], frames
+
+
+def test_dataset_stats_match_pandas(tmp_path):
+    paths, frames = _write_files(tmp_path)
+    stats = dataset_stats(paths, workers=2, chunksize=128, partitions=4)
+    merged = pd.concat(frames, ignore_index=True)
+
+    assert stats["rows"] == len(merged)
+    assert stats["labels"] == {str(k): int(v) for k, v in merged["attack"].value_counts().items()}
+    assert stats["duplicates_across_files"] == int(merged.duplicated().sum())
+    assert [f["duplicates"] for f in stats["files"].values()] == [int(df.duplicated().sum()) for df in frames]
+    summary = stats["summary"].set_index("feature")
+    assert list(summary.index) == ["arbitration_id", "attack", "dls"]
+    assert summary.loc["dls", "max"] == merged["dls"].max()
+    assert np.isclose(summary.loc["arbitration_id", "mean"], merged["arbitration_id"].mean())
+
+
+def test_deep_metric_file_csv_reports_dataset_stats(tmp_path):
+    paths, frames = _write_files(tmp_path)
+    amount, summary = deep_metric_file_csv(str(tmp_path), str(tmp_path / "out" / "summary"), workers=2)
+    merged = pd.concat(frames, ignore_index=True)
+    assert amount == len(merged)
+    assert summary.set_index("feature").loc["dls", "max"] == merged["dls"].max()
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "out" / "summary.csv"), summary)
+
+
+def test_duplicates_across_files_compare_values(tmp_path):
+    (tmp_path / "a.csv").write_text("arbitration_id,dls,data_field,attack\n0100,8,00ff,1\n0200,2,0a,0\n")
+    # Same first row with the columns reordered and the numbers spelled as floats
+    (tmp_path / "b.csv").write_text("attack,data_field,dls,arbitration_id\n1.0,00ff,8.0,0100\n0,000a,2,0200\n")
+    stats = dataset_stats([str(tmp_path / "a.csv"), str(tmp_path / "b.csv")], workers=1, partitions=2)
+    assert stats["duplicates_across_files"] == 1
+    assert stats["labels"] == {"1": 2, "0": 2}
+
+
+def test_reservoir_balancer_never_repeats_rows():
+    balancer = ReservoirBalancer("label", {0: 0.5, 1: 0.5}, capacity=100)
+    for label, n in ((0, 1000), (1, 800)):
+        for block in np.array_split(np.arange(n), 7):
+            balancer.update(pd.DataFrame({"label": label, "x": block + label * 10 ** 6}))
+    result = balancer.result()
+    assert result.groupby("label")["x"].agg(["size", "nunique"]).to_numpy().tolist() == [[100, 100], [100, 100]]
+
+    single = ReservoirBalancer("label", {0: 0.5, 1: 0.5}, capacity=100)
+    single.update(pd.DataFrame({"label": 0, "x": np.arange(1000)}))
+    assert single.result()["x"].nunique() == len(single.result()) == 100
+
+
+def test_balance_stream_keeps_hex_text_of_digit_only_chunks(tmp_path):
+    rows = [f"{i / 100},0350,0000000000000000,{i % 2}" for i in range(20)]
+    rows += [f"{i / 100},02A0,0A0B0C0D0E0F0102,{i % 2}" for i in range(20, 40)]
+    source = tmp_path / "capture.csv"
+    source.write_text("timestamp,arbitration_id,data_field,attack\n" + "\n".join(rows) + "\n")
+
+    # The first 20-row chunk holds only digits
+    balanced = balance_dataset_stream(str(source), ratios={0: 0.5, 1: 0.5}, chunksize=20)
+    target = tmp_path / "balanced.csv"
+    write_dataset(balanced, target)
+    written = pd.read_csv(target, dtype=str)
+    assert set(written["arbitration_id"]) == {"0350", "02A0"}
+    assert set(written["data_field"]) == {"0000000000000000", "0A0B0C0D0E0F0102"}
@@ -0,0 +1,18 @@
+import pandas as pd
+import pytest
+
+# search_hyperparams reuses train.preprocess_data, which pulls in the plotting stack
+pytest.importorskip("matplotlib")
+pytest.importorskip("seaborn")
+
+from search_hyperparams import pareto_front  # noqa: E402
+
+
+def test_pareto_front():
+    results = pd.DataFrame({
+        "accuracy": [0.99, 0.98, 0.99, 0.97],
+        "total_nodes": [400, 200, 500, 200],
+        "latency_cycles": [24, 20, 24, 20],
+    })
+    # Row 2 is beaten by row 0 and row 3 by row 1
+    assert pareto_front(results).tolist() == [True, True, False, False]